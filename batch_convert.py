@@ -0,0 +1,139 @@
+"""
+Пакетная конвертация DXF за один запуск Python (ezdxf импортируется один раз на все файлы).
+
+Примеры:
+    python batch_convert.py "archive/**/*.dxf" --output-dir converted
+    python batch_convert.py archive/ --dry-run
+    python batch_convert.py - < input.dxf > output.dxf
+
+Входы — файлы, папки (обрабатываются рекурсивно) или шаблоны glob; "-" — чтение из stdin и запись в stdout.
+Без --output-dir файлы заменяются на месте, как это делает обработчик в main.py.
+"""
+import argparse
+import contextlib
+import glob
+import sys
+import time
+from pathlib import Path
+
+import ezdxf
+
+from constants import CONTOUR_DEPTH_LAYERS, CONVERT_BLOCKS, CONVERT_TOL
+from convert_dxf import convert_dxf_bytes, is_already_converted
+from process_dxf_utils import get_all_dxf_files, write_atomically
+
+
+def glob_base(pattern) -> Path:
+    """Часть шаблона glob до первого компонента с подстановочными символами ("." — если шаблон с него начинается)."""
+    parts = []
+    for part in Path(pattern).parts:
+        if glob.has_magic(part):
+            break
+        parts.append(part)
+    return Path(*parts) if parts else Path(".")
+
+
+def ignore_dxf_suffix_case(pattern):
+    """Шаблон, в котором расширение .dxf совпадает в любом регистре: glob на Linux регистр различает."""
+    if pattern.lower().endswith(".dxf"):
+        return pattern[:-4] + ".[dD][xX][fF]"
+    return pattern
+
+
+def is_inside(path: Path, directory: Path) -> bool:
+    return path.resolve().is_relative_to(directory.resolve())
+
+
+def expand_inputs(patterns):
+    """
+    Раскрывает аргументы в список (путь_к_файлу, путь_относительно_корня_аргумента).
+    Корень шаблона glob — его часть до первого подстановочного символа, как папка для аргумента-папки.
+    Расширение .dxf, как и при обходе папок, сравнивается без учёта регистра.
+    """
+    files = []
+    for pattern in patterns:
+        path = Path(pattern)
+        if path.is_dir():
+            files += [(f, f.relative_to(path)) for f in sorted(get_all_dxf_files(path))]
+        elif glob.has_magic(pattern):
+            base = glob_base(pattern)
+            matches = sorted(glob.glob(ignore_dxf_suffix_case(pattern), recursive=True))
+            files += [(Path(f), Path(f).relative_to(base)) for f in matches if Path(f).suffix.lower() == ".dxf"]
+        elif path.is_file():
+            files.append((path, Path(path.name)))
+        else:
+            print(f"⚠️ Не найдено: {pattern}", file=sys.stderr)
+    return files
+
+
+def convert_stdin_to_stdout(tol, blocks=False, depth_layers=False):
+    """
+    Режим конвейера: DXF из stdin, результат в stdout; диагностика конвертера уходит в stderr.
+    Ошибка конвертации сообщается так же, как в режиме файлов, с кодом выхода 1.
+    """
+    data = sys.stdin.buffer.read()
+    with contextlib.redirect_stdout(sys.stderr):
+        try:
+            output = convert_dxf_bytes(data, tol, blocks=blocks, depth_layers=depth_layers)
+        except (ezdxf.DXFError, UnicodeDecodeError) as e:
+            print(f"❌ Ошибка при обработке stdin: {e}")
+            sys.exit(1)
+    sys.stdout.buffer.write(output)
+    sys.stdout.buffer.flush()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Пакетная конвертация DXF: LINE/ARC/CIRCLE -> замкнутые LWPOLYLINE")
+    parser.add_argument("inputs", nargs="+", help='файлы, папки или шаблоны glob ("**" — рекурсивно); "-" — stdin')
+    parser.add_argument("--output-dir", type=Path, help="куда писать результаты (структура папок сохраняется); "
+                                                        "по умолчанию файлы заменяются на месте")
+    parser.add_argument("--dry-run", action="store_true", help="только конвертировать в памяти и показать итог, "
+                                                               "ничего не записывая")
+    parser.add_argument("--force", action="store_true", help="конвертировать и файлы с меткой текущей версии")
+    parser.add_argument("--tol", type=float, default=CONVERT_TOL, help="допуск совпадения концов сегментов")
+    parser.add_argument("--blocks", action="store_true", default=CONVERT_BLOCKS,
+                        help="конвертировать также определения блоков, на которые ссылаются INSERT")
+    parser.add_argument("--depth-layers", action="store_true", default=CONTOUR_DEPTH_LAYERS,
+                        help="раскладывать контуры по слоям CUT_<глубина вложенности>")
+    args = parser.parse_args()
+
+    if args.inputs == ["-"]:
+        convert_stdin_to_stdout(args.tol, args.blocks, args.depth_layers)
+        return
+
+    files = expand_inputs(args.inputs)
+    converted, skipped, failed = 0, 0, 0
+    started = time.perf_counter()
+    for input_path, rel_path in files:
+        if args.output_dir and not args.dry_run and not is_inside(args.output_dir / rel_path, args.output_dir):
+            print(f"❌ Результат {input_path} оказался бы вне {args.output_dir}: {args.output_dir / rel_path}")
+            failed += 1
+            continue
+        if not args.force and is_already_converted(input_path, args.tol, args.blocks, args.depth_layers):
+            print(f"⏭️ Уже сконвертирован, пропуск: {input_path}")
+            skipped += 1
+            continue
+        try:
+            output = convert_dxf_bytes(input_path.read_bytes(), args.tol, blocks=args.blocks,
+                                       depth_layers=args.depth_layers)
+        except (OSError, ezdxf.DXFError, UnicodeDecodeError) as e:
+            print(f"❌ Ошибка при обработке {input_path}: {e}")
+            failed += 1
+            continue
+
+        if args.dry_run:
+            print(f"🔎 {input_path}: {len(output)} байт (не записано, --dry-run)")
+        else:
+            target = args.output_dir / rel_path if args.output_dir else input_path
+            write_atomically(target, output)
+            print(f"✅ {input_path} -> {target}")
+        converted += 1
+
+    print(f"Итого: сконвертировано {converted}, пропущено {skipped}, ошибок {failed}, "
+          f"{time.perf_counter() - started:.1f} с")
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+"""
+Воспроизводимый бенчмарк конвертера на синтетических чертежах.
+
+Пример:
+    python benchmark.py --parts 150 1500 15000 --mode memory streaming --results bench_results.jsonl
+
+Каждый прогон выполняется в отдельном процессе (чтобы пиковая память считалась по одному прогону),
+результаты дописываются строками JSON в файл --results для сравнения между версиями.
+"""
+import argparse
+import contextlib
+import io
+import json
+import math
+import platform
+import random
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+
+import ezdxf
+
+from convert_dxf import CONVERTER_VERSION, convert_dxf_with_bulge
+from metrics import ConversionMetrics
+from stream_convert import convert_dxf_streaming
+from worker_pool import run_in_processes
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+CONVERTERS = {"memory": convert_dxf_with_bulge, "streaming": convert_dxf_streaming}
+
+
+def generate_drawing(path, parts, seed=1, hole_ratio=1.0, slot_ratio=0.33, gap_ratio=0.1, open_ratio=0.15,
+                     shuffle=True, tol=1e-2):
+    """
+    Создаёт синтетический чертёж из parts деталей, разложенных сеткой.
+
+    Каждая деталь — прямоугольник из 4 LINE (направление отрезков случайное), с вероятностью hole_ratio —
+    круглое отверстие (CIRCLE), slot_ratio — паз из двух ARC и двух LINE, open_ratio — лишний незамкнутый отрезок.
+    С вероятностью gap_ratio конец отрезка сдвигается на величину чуть меньше tol (стык на грани допуска).
+    shuffle перемешивает порядок объектов, как в реальных экспортах. Возвращает число созданных сегментов.
+    """
+    rnd = random.Random(seed)
+    doc = ezdxf.new("R2010")
+    msp = doc.modelspace()
+    columns = max(1, int(math.sqrt(parts)))
+    near_gap = tol * 0.7 / math.sqrt(2)
+
+    shapes = []
+    for k in range(parts):
+        x0, y0 = (k % columns) * 40.0, (k // columns) * 40.0
+        width, height = 20 + rnd.random() * 10, 20 + rnd.random() * 10
+        corners = [(x0, y0), (x0 + width, y0), (x0 + width, y0 + height), (x0, y0 + height)]
+        for i in range(4):
+            start, end = corners[i], corners[(i + 1) % 4]
+            if rnd.random() < gap_ratio:
+                end = (end[0] + near_gap, end[1] - near_gap)
+            shapes.append(("LINE", start, end))
+        if rnd.random() < hole_ratio:
+            shapes.append(("CIRCLE", (x0 + width / 2, y0 + height / 2), 1 + rnd.random() * 3))
+        if rnd.random() < slot_ratio:
+            cx, cy = x0 + 4, y0 + 4
+            shapes.append(("ARC", (cx, cy), 1.0, 90.0, 270.0))
+            shapes.append(("ARC", (cx + 6, cy), 1.0, 270.0, 90.0))
+            shapes.append(("LINE", (cx, cy + 1), (cx + 6, cy + 1)))
+            shapes.append(("LINE", (cx + 6, cy - 1), (cx, cy - 1)))
+        if rnd.random() < open_ratio:
+            shapes.append(("LINE", (x0 + 2, y0 + height - 3), (x0 + 8, y0 + height - 3)))
+
+    if shuffle:
+        rnd.shuffle(shapes)
+
+    segments = 0
+    for shape in shapes:
+        if shape[0] == "LINE":
+            start, end = shape[1], shape[2]
+            if rnd.random() < 0.5:
+                start, end = end, start
+            msp.add_line(start, end)
+            segments += 1
+        elif shape[0] == "CIRCLE":
+            msp.add_circle(shape[1], shape[2])
+            segments += 2  # круг превращается в две дуги
+        else:
+            msp.add_arc(shape[1], shape[2], shape[3], shape[4])
+            segments += 1
+    doc.saveas(path)
+    return segments
+
+
+def peak_rss_mb():
+    """Пиковая память текущего процесса в МБ (None, если недоступно)."""
+    # VmHWM относится к текущему образу процесса; ru_maxrss в Linux наследуется через fork/exec от родителя
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux возвращает КБ, macOS — байты
+    return round(peak / (1024 * 1024 if platform.system() == "Darwin" else 1024), 1)
+
+
+def run_case(case):
+    """Выполняется в отдельном процессе: замеряет конвертацию заранее сгенерированного чертежа."""
+    case = dict(case)
+    input_path = Path(case.pop("input"))
+    output_path = input_path.with_name(f"{input_path.stem}_{case['mode']}_out.dxf")
+
+    metrics = ConversionMetrics(str(input_path))
+    with contextlib.redirect_stdout(io.StringIO()):  # Вывод конвертера в бенчмарке не нужен
+        started = time.perf_counter()
+        CONVERTERS[case["mode"]](str(input_path), str(output_path), tol=case["tol"], metrics=metrics)
+        elapsed = time.perf_counter() - started
+    output_path.unlink(missing_ok=True)
+
+    segments = case["segments"]
+    return {
+        **case,
+        "seconds": round(elapsed, 4),
+        "segments_per_second": round(segments / elapsed, 1) if elapsed else None,
+        "peak_rss_mb": peak_rss_mb(),
+        "stages": {name: round(seconds, 4) for name, seconds in metrics.stages.items()},
+        "counters": metrics.counters,
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=Path(__file__).parent, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Бенчмарк конвертера DXF на синтетических чертежах")
+    parser.add_argument("--parts", type=int, nargs="+", default=[150, 1500, 15000],
+                        help="число деталей в чертеже (~7 сегментов на деталь)")
+    parser.add_argument("--mode", choices=sorted(CONVERTERS), nargs="+", default=["memory"])
+    parser.add_argument("--repeat", type=int, default=1, help="повторов каждого прогона")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--tol", type=float, default=1e-2)
+    parser.add_argument("--timeout", type=float, default=3600, help="лимит времени на прогон, секунд")
+    parser.add_argument("--results", default="bench_results.jsonl", help="файл для результатов (JSON lines)")
+    args = parser.parse_args()
+
+    run_info = {
+        "run_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "git": git_revision(),
+        "converter_version": CONVERTER_VERSION,
+        "python": platform.python_version(),
+        "ezdxf": ezdxf.__version__,
+    }
+    # По одному процессу за раз: параллельные прогоны искажали бы время и память
+    with tempfile.TemporaryDirectory() as tmp, open(args.results, "a", encoding="utf-8") as results:
+        # Чертежи генерируются заранее, чтобы генерация не влияла на замер времени и памяти конвертации
+        cases = []
+        for parts in args.parts:
+            input_path = Path(tmp) / f"parts_{parts}.dxf"
+            segments = generate_drawing(input_path, parts, seed=args.seed, tol=args.tol)
+            cases += [{"input": str(input_path), "parts": parts, "segments": segments, "mode": mode,
+                       "seed": args.seed, "tol": args.tol, "repeat": repeat}
+                      for mode in args.mode for repeat in range(args.repeat)]
+
+        # spawn: дочерний процесс не наследует память родителя, и пиковый RSS относится только к прогону
+        for case, ok, result in run_in_processes(run_case, cases, 1, args.timeout, start_method="spawn"):
+            if not ok:
+                print(f"❌ {case}: {result}")
+                continue
+            results.write(json.dumps({**run_info, **result}, ensure_ascii=False) + "\n")
+            stages = ", ".join(f"{name} {seconds:.2f}" for name, seconds in result["stages"].items())
+            print(f"⏱️ {result['mode']:9} {result['segments']:>8} сегм.: {result['seconds']:.2f} с, "
+                  f"{result['segments_per_second']:.0f} сегм./с, RSS {result['peak_rss_mb']} МБ | {stages}")
+
+
+if __name__ == "__main__":
+    main()
@@ -9,9 +9,39 @@ BASE_WEBHOOK = os.getenv("BASE_WEBHOOK")
 DXF_DIR = os.getenv("DXF_DIR")
 CHAT_ID_KO = os.getenv("CHAT_ID_KO")
 CHAT_ID_KTO = os.getenv("CHAT_ID_KTO")
+NOTIFY_CHAT_ID = os.getenv("NOTIFY_CHAT_ID")  # чат Bitrix24 для уведомлений об ошибках конвертации, пусто — не отправлять
 
 # 📁 Настройки
 INPUT_DIR = DXF_DIR
-INDEX_JSON = "index.json"
+INDEX_JSON = "index.json"  # старый индекс, переносится в INDEX_DB при первом запуске
+INDEX_DB = "index.sqlite3"
+CONVERT_TOL = 1e-2  # допуск совпадения концов сегментов при построении контуров
+CONVERT_BLOCKS = False  # конвертировать также определения блоков, на которые ссылаются INSERT
+CONTOUR_DEPTH_LAYERS = False  # раскладывать контуры по слоям CUT_0, CUT_1, ... по глубине вложенности
 CHECK_INTERVAL = 5  # каждые 5 минут
 DELAY_BETWEEN_FILES = 0.1  # каждые 6 секунд
+MAX_WORKERS = os.cpu_count() or 1  # число процессов конвертации (1 — последовательная обработка)
+MAX_IN_FLIGHT = MAX_WORKERS  # сколько файлов очереди обрабатывается одновременно (не больше MAX_WORKERS)
+SCHEDULE_POLICY = "smallest"  # порядок очереди: "fifo", "newest" (сначала свежие) или "smallest" (сначала маленькие)
+SCHEDULE_FAIR_FOLDERS = False  # чередовать папки первого уровня DXF_DIR, чтобы одна выгрузка не занимала очередь
+FILE_TIMEOUT = 300  # лимит времени на конвертацию одного файла, секунд
+FILE_MEMORY_LIMIT = 4 * 1024 ** 3  # лимит памяти процесса конвертации одного файла (байт, Unix), None — без лимита
+FAILURE_BACKOFF = 60  # пауза перед повтором после первой ошибки, секунд; удваивается с каждой следующей
+FAILURE_BACKOFF_MAX = 6 * 3600  # предел паузы между повторами, секунд
+QUARANTINE_AFTER = 5  # после стольких ошибок подряд файл переносится в карантин
+QUARANTINE_DIR = "dxf_quarantine"  # папка карантина, None — не переносить, только повторять с паузой
+WATCH_MODE = "auto"  # "auto" — inotify, кроме сетевых папок (SMB/NFS), "inotify" — всегда inotify, "poll" — опрос
+WATCH_DEBOUNCE = 0.5  # файл обрабатывается, если по нему не было событий столько секунд (режим inotify)
+RECONCILE_INTERVAL = 600  # полная сверка папки в режиме inotify, секунд
+STREAMING_MIN_SIZE = 50 * 1024 * 1024  # файлы больше этого размера (байт) конвертируются в потоковом режиме
+IO_THREADS = 4  # потоки чтения файлов наперёд и столько же потоков отложенной записи результатов
+PREFETCH_FILES = 4  # сколько ближайших файлов очереди держать прочитанными в памяти
+WRITE_BEHIND_FILES = 8  # сколько результатов может ждать записи, прежде чем конвертация подождёт запись
+OUTPUT_CACHE_DIR = "dxf_cache"  # кеш результатов конвертации одинаковых файлов, None — не использовать
+OUTPUT_CACHE_MAX_BYTES = 2 * 1024 ** 3  # предельный размер кеша, старые записи вытесняются
+PROFILE_SLOW_SECONDS = None  # профилировать конвертации дольше стольких секунд, None — только по сигналу SIGUSR1
+PROFILE_DIR = "dxf_profiles"  # снимки для воспроизведения медленных файлов: копия исходника, профили по этапам
+PROFILE_MAX_CAPTURES = 20  # сколько последних снимков хранить
+PROFILE_MAX_PENDING = 2  # сколько медленных файлов может ждать фонового профилирования, остальные только копируются
+METRICS_LOG = "metrics.jsonl"  # журнал метрик по файлам (JSON lines), None — не писать
+METRICS_PORT = 9108  # локальный порт метрик в формате Prometheus (http://127.0.0.1:9108/metrics), None — выключено
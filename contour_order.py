@@ -0,0 +1,245 @@
+import math
+
+import numpy as np
+
+# Шаг аппроксимации дуг (bulge) ломаной при проверке вложенности: прогиб хорды не больше ~0.1% радиуса
+ARC_STEP = math.pi / 32
+# Прямоугольник, покрывающий больше ячеек сетки, проверяется для каждого запроса (например, контур листа)
+MAX_CELLS_PER_BOX = 64
+
+
+def flatten_contour(chain):
+    """
+    Замкнутый контур [(x, y, bulge), ...] в виде ломаной [(x, y), ...]: дуги заменяются хордами
+    с шагом не больше ARC_STEP по углу.
+    """
+    points = []
+    count = len(chain)
+    for k, (x1, y1, bulge) in enumerate(chain):
+        points.append((x1, y1))
+        if not bulge:
+            continue
+        x2, y2 = chain[(k + 1) % count][:2]
+        dx, dy = x2 - x1, y2 - y1
+        # Центр дуги: середина хорды плюс смещение по левой нормали, (1 - b²) / (4b) — это cot(θ/2) / 2
+        offset = (1 - bulge * bulge) / (4 * bulge)
+        cx, cy = (x1 + x2) / 2 - offset * dy, (y1 + y2) / 2 + offset * dx
+        sweep = 4 * math.atan(bulge)  # центральный угол, против часовой стрелки > 0
+        radius = math.hypot(x1 - cx, y1 - cy)
+        start_angle = math.atan2(y1 - cy, x1 - cx)
+        steps = max(2, math.ceil(abs(sweep) / ARC_STEP))
+        for step in range(1, steps):
+            angle = start_angle + sweep * step / steps
+            points.append((cx + radius * math.cos(angle), cy + radius * math.sin(angle)))
+    return points
+
+
+def contour_area_and_box(chain):
+    """
+    Площадь замкнутого контура с дугами (по модулю) и охватывающий прямоугольник (x0, y0, x1, y1).
+    Площадь точная: формула шнурования по вершинам плюс площади круговых сегментов дуг.
+    Прямоугольник с запасом: для дуги берётся прямоугольник всей её окружности.
+    """
+    area = 0.0
+    xs, ys = [], []
+    count = len(chain)
+    for k, (x1, y1, bulge) in enumerate(chain):
+        x2, y2 = chain[(k + 1) % count][:2]
+        area += (x1 * y2 - x2 * y1) / 2
+        xs.append(x1)
+        ys.append(y1)
+        if not bulge:
+            continue
+        sweep = 4 * math.atan(abs(bulge))
+        radius = math.hypot(x2 - x1, y2 - y1) / (2 * math.sin(sweep / 2))
+        # Сегмент дуги добавляет площадь при bulge > 0 (дуга против часовой стрелки) и вычитает при bulge < 0
+        area += math.copysign(radius * radius * (sweep - math.sin(sweep)) / 2, bulge)
+        cx, cy = (x1 + x2) / 2, (y1 + y2) / 2
+        xs += [cx - radius, cx + radius]
+        ys += [cy - radius, cy + radius]
+    return abs(area), (min(xs), min(ys), max(xs), max(ys))
+
+
+def point_in_polygon(x, y, points):
+    """Лежит ли точка внутри многоугольника (чётность пересечений горизонтального луча)."""
+    inside = False
+    x0, y0 = points[-1]
+    for x1, y1 in points:
+        if (y1 > y) != (y0 > y) and x < x0 + (y - y0) * (x1 - x0) / (y1 - y0):
+            inside = not inside
+        x0, y0 = x1, y1
+    return inside
+
+
+class BoxGrid:
+    """
+    Сетка прямоугольников (bounding box) для поиска контуров, чей прямоугольник содержит точку.
+    Прямоугольник записывается во все покрытые ячейки; слишком большие (например, контур листа)
+    хранятся отдельно и проверяются при каждом запросе.
+    """
+
+    def __init__(self, boxes, cell_size):
+        self.boxes = boxes
+        self.cell_size = cell_size if cell_size > 0 else 1.0
+        self._cells = {}
+        self._large = []
+        for index, (x0, y0, x1, y1) in enumerate(boxes):
+            cx0, cy0 = self._cell(x0, y0)
+            cx1, cy1 = self._cell(x1, y1)
+            if (cx1 - cx0 + 1) * (cy1 - cy0 + 1) > MAX_CELLS_PER_BOX:
+                self._large.append(index)
+                continue
+            for cx in range(cx0, cx1 + 1):
+                for cy in range(cy0, cy1 + 1):
+                    self._cells.setdefault((cx, cy), []).append(index)
+
+    def _cell(self, x, y):
+        return math.floor(x / self.cell_size), math.floor(y / self.cell_size)
+
+    def containing(self, x, y):
+        """Индексы прямоугольников, содержащих точку (x, y)."""
+        for index in self._cells.get(self._cell(x, y), []) + self._large:
+            x0, y0, x1, y1 = self.boxes[index]
+            if x0 <= x <= x1 and y0 <= y <= y1:
+                yield index
+
+
+def nesting_parents(chains):
+    """
+    Дерево вложенности контуров: для каждого контура — индекс наименьшего по площади охватывающего
+    контура или None. Кандидаты отбираются по сетке прямоугольников, точная проверка (точка в многоугольнике)
+    выполняется только для контуров, чей прямоугольник содержит вершину проверяемого контура.
+    Возвращает (parents, depths).
+    """
+    areas, boxes = [], []
+    for chain in chains:
+        area, box = contour_area_and_box(chain)
+        areas.append(area)
+        boxes.append(box)
+    sizes = [max(x1 - x0, y1 - y0) for x0, y0, x1, y1 in boxes]
+    # Ячейка по крупным контурам: иначе каждый прямоугольник детали ложится в десятки ячеек
+    grid = BoxGrid(boxes, float(np.percentile(sizes, 90)) if sizes else 1.0)
+
+    polygons = {}  # Ломаные строятся только для контуров-кандидатов
+    parents = [None] * len(chains)
+    for i, chain in enumerate(chains):
+        x, y = chain[0][0], chain[0][1]
+        for j in grid.containing(x, y):
+            if areas[j] <= areas[i] or (parents[i] is not None and areas[j] >= areas[parents[i]]):
+                continue
+            if j not in polygons:
+                polygons[j] = flatten_contour(chains[j])
+            if point_in_polygon(x, y, polygons[j]):
+                parents[i] = j
+
+    # Родитель всегда больше по площади, поэтому при обходе по убыванию площади его глубина уже известна
+    depths = [0] * len(chains)
+    for i in sorted(range(len(chains)), key=lambda k: -areas[k]):
+        if parents[i] is not None:
+            depths[i] = depths[parents[i]] + 1
+    return parents, depths
+
+
+class PointGrid:
+    """
+    Сетка точек для жадного обхода по ближайшему соседу. pop_nearest просматривает ячейки кольцами
+    вокруг позиции, пока следующее кольцо не окажется дальше уже найденной точки; если колец набирается
+    больше, чем осталось точек (позиция далеко или точки разрежены), перебираются все оставшиеся точки.
+    """
+
+    def __init__(self, indices, xs, ys):
+        self.xs = xs
+        self.ys = ys
+        self.count = len(indices)
+        width = float(xs[indices].max() - xs[indices].min())
+        height = float(ys[indices].max() - ys[indices].min())
+        # В среднем около одной точки на ячейку
+        self.cell_size = max(math.sqrt(width * height / self.count), (width + height) / self.count, 1e-9)
+        self._cells = {}
+        for index in indices:
+            self._cells.setdefault(self._cell(xs[index], ys[index]), []).append(int(index))
+
+    def _cell(self, x, y):
+        return math.floor(x / self.cell_size), math.floor(y / self.cell_size)
+
+    def _closer(self, candidates, x, y, best, best_distance):
+        for index in candidates:
+            distance = (self.xs[index] - x) ** 2 + (self.ys[index] - y) ** 2
+            # При равном расстоянии — меньший индекс, как у np.argmin по упорядоченному списку
+            if distance < best_distance or (distance == best_distance and index < best):
+                best, best_distance = index, distance
+        return best, best_distance
+
+    def pop_nearest(self, x, y):
+        """Удаляет и возвращает индекс ближайшей к (x, y) точки."""
+        cx, cy = self._cell(x, y)
+        best, best_distance = None, math.inf
+        ring = 0
+        while True:
+            if (2 * ring + 1) ** 2 > 4 * self.count:
+                best, best_distance = None, math.inf
+                for candidates in self._cells.values():
+                    best, best_distance = self._closer(candidates, x, y, best, best_distance)
+                break
+            cells = [(cx, cy)] if ring == 0 else (
+                [(cx + d, cy - ring) for d in range(-ring, ring + 1)]
+                + [(cx + d, cy + ring) for d in range(-ring, ring + 1)]
+                + [(cx - ring, cy + d) for d in range(-ring + 1, ring)]
+                + [(cx + ring, cy + d) for d in range(-ring + 1, ring)])
+            for cell in cells:
+                best, best_distance = self._closer(self._cells.get(cell, ()), x, y, best, best_distance)
+            # Точки за кольцом ring не ближе ring * cell_size
+            if best is not None and (ring * self.cell_size) ** 2 > best_distance:
+                break
+            ring += 1
+
+        key = self._cell(self.xs[best], self.ys[best])
+        self._cells[key].remove(best)
+        if not self._cells[key]:
+            del self._cells[key]
+        self.count -= 1
+        return best
+
+
+def _rotate_to_nearest(chain, position):
+    """Начало замкнутого контура переносится в вершину, ближайшую к position; геометрия не меняется."""
+    px, py = position
+    nearest = min(range(len(chain)), key=lambda k: (chain[k][0] - px) ** 2 + (chain[k][1] - py) ** 2)
+    return chain[nearest:] + chain[:nearest]
+
+
+def order_contours(chains, start=(0.0, 0.0)):
+    """
+    Порядок резки: внутренние контуры раньше охватывающих, соседние — по ближайшему соседу от текущей
+    позиции инструмента (начиная со start). Начало каждого контура переносится в ближайшую вершину.
+    Возвращает список (контур, глубина вложенности) — 0 у внешних контуров.
+    """
+    if not chains:
+        return []
+    parents, depths = nesting_parents(chains)
+    children = [[] for _ in chains]
+    roots = []
+    for i, parent in enumerate(parents):
+        (roots if parent is None else children[parent]).append(i)
+
+    first_x = np.array([chain[0][0] for chain in chains], dtype=float)
+    first_y = np.array([chain[0][1] for chain in chains], dtype=float)
+    ordered = []
+    position = start
+
+    def cut_group(indices):
+        # Жадно по ближайшему соседу; у каждого контура сначала режутся вложенные в него
+        nonlocal position
+        if not indices:
+            return
+        remaining = PointGrid(indices, first_x, first_y)
+        while remaining.count:
+            index = remaining.pop_nearest(*position)
+            if children[index]:
+                cut_group(children[index])
+            chain = _rotate_to_nearest(chains[index], position)
+            ordered.append((chain, depths[index]))
+            position = (chain[0][0], chain[0][1])
+
+    cut_group(roots)
+    return ordered
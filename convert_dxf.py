@@ -1,7 +1,23 @@
+import io
 import math
+import os
 
 import ezdxf
-from ezdxf.math import Vec3
+import numpy as np
+from ezdxf.entities import Arc
+from ezdxf.filemanagement import dxf_stream_info
+
+from contour_order import order_contours
+from endpoint_index import NEIGHBOUR_DX, NEIGHBOUR_DY, EndpointIndex, cell_key, grid_cells
+from layout_batch import LayoutEditBatch
+from metrics import ConversionMetrics
+from segment_table import SegmentTable, segment_row
+
+# Меняется при любом изменении результата конвертации: файлы, сконвертированные другой версией, обрабатываются заново
+CONVERTER_VERSION = "3"
+
+# Пользовательская переменная HEADER ($CUSTOMPROPERTYTAG/$CUSTOMPROPERTY), которой помечается результат конвертации
+CONVERTER_MARKER_TAG = "DXFCONVERTER"
 
 
 def is_close(p1, p2, tol=1e-2):
@@ -37,246 +53,456 @@ def arc_bulge(start_pt_tuple, end_pt_tuple, center_pt_tuple):
     return bulge
 
 
-def convert_dxf_with_bulge(input_path, output_path, tol=1e-2):
+def converter_marker(tol=1e-2, blocks=False, depth_layers=False, handle_seed=None):
+    """Значение метки конвертера: версия, допуск и режимы, с которыми получен файл."""
+    marker = f"version={CONVERTER_VERSION};tol={tol!r}"
+    if blocks:
+        marker += ";blocks=1"
+    if depth_layers:
+        marker += ";depth_layers=1"
+    if handle_seed is not None:
+        marker += f";handseed={handle_seed}"
+    return marker
+
+
+def contour_layer(depth, depth_layers=False):
+    """Слой LWPOLYLINE контура: CUT или, в режиме depth_layers, CUT_<глубина вложенности> (CUT_0 — внешние)."""
+    return f"CUT_{depth}" if depth_layers else "CUT"
+
+
+def read_converter_marker(source):
     """
-    Конвертирует DXF файл, объединяя LINE, ARC и CIRCLE в замкнутые LWPOLYLINE с bulge.
-    Круги разбиваются на две дуги по 180 градусов.
+    Читает метку конвертера, не загружая чертёж: разбирает только секцию HEADER в начале файла.
+    source — путь к файлу или уже прочитанное содержимое (bytes).
+    Возвращает (значение метки, $HANDSEED файла); None вместо метки — метки нет, файл бинарный
+    или не начинается с HEADER.
+    """
+    with io.BytesIO(source) if isinstance(source, bytes) else open(source, "rb") as f:
+        if f.read(18) == b"AutoCAD Binary DXF":
+            return None, None
+        f.seek(0)
+
+        header_var = None  # Имя текущей переменной HEADER (группа 9)
+        property_tag = None  # Последний прочитанный $CUSTOMPROPERTYTAG
+        marker = handle_seed = None
+        while True:
+            code_line = f.readline()
+            value_line = f.readline()
+            if not value_line:
+                return None, None
+            code = code_line.strip().lstrip(b"\xef\xbb\xbf")
+            value = value_line.strip().decode("utf-8", errors="replace")
+
+            if code == b"0" and value == "ENDSEC":
+                return marker, handle_seed  # Секция HEADER закончилась
+            if code == b"2" and header_var is None and value != "HEADER":
+                return None, None  # Первая секция — не HEADER
+            if code == b"9":
+                header_var = value
+            elif code == b"5" and header_var == "$HANDSEED":
+                handle_seed = value
+            elif code == b"1" and header_var == "$CUSTOMPROPERTYTAG":
+                property_tag = value
+            elif code == b"1" and header_var == "$CUSTOMPROPERTY" and property_tag == CONVERTER_MARKER_TAG:
+                marker = value
+            if marker is not None and handle_seed is not None:
+                return marker, handle_seed
+
+
+def is_already_converted(source, tol=1e-2, blocks=False, depth_layers=False):
+    """
+    Быстрая проверка: файл уже сконвертирован текущей версией с тем же допуском и режимами
+    и с тех пор в него не добавляли объектов ($HANDSEED файла тот же, что записан в метке).
+    source — путь к файлу или его содержимое (bytes).
     """
-    print(f"Чтение файла: {input_path}")
     try:
-        doc = ezdxf.readfile(input_path)
-    except IOError:
-        print(f"Не удалось открыть файл: {input_path}")
-        return
-    except ezdxf.DXFStructureError:
-        print(f"Ошибка структуры DXF файла: {input_path}")
-        return
+        marker, handle_seed = read_converter_marker(source)
+        return marker is not None and marker == converter_marker(tol, blocks, depth_layers, handle_seed)
+    except OSError:
+        return False
 
-    msp = doc.modelspace()
 
-    # 1. Конвертация CIRCLE (Кругов) в ARC (Дуги)
-    circles_to_convert = list(msp.query("CIRCLE"))  # Материализуем запрос перед изменением msp
-    print(f"Найдено исходных CIRCLE: {len(circles_to_convert)}")
-
-    newly_created_arcs_from_circles = []
-    for circle in circles_to_convert:
-        center = circle.dxf.center  # Vec3
-        radius = circle.dxf.radius
-
-        # Сохраняем атрибуты оригинального круга для новых дуг
-        attribs = {}
-        if circle.dxf.hasattr("layer"):
-            attribs["layer"] = circle.dxf.layer
-        else:
-            attribs["layer"] = "0"  # Слой по умолчанию
-        if circle.dxf.hasattr("color"):
-            attribs["color"] = circle.dxf.color
-        # При необходимости можно добавить другие атрибуты
-
-        # Создаем 2 дуги по 180 градусов для каждого круга
-        # Углы в градусах, против часовой стрелки от оси X
-        for i in range(2):  # Цикл дважды для двух дуг
-            start_angle_deg = i * 180.0
-            end_angle_deg = (i + 1) * 180.0
-            if end_angle_deg >= 360.0:
-                end_angle_deg = 359.9999  # FIX: избегаем исчезновения дуги
-
-            new_arc = msp.add_arc(center=center, radius=radius,
-                                  start_angle=start_angle_deg, end_angle=end_angle_deg,
-                                  dxfattribs=attribs)
-
-            newly_created_arcs_from_circles.append(new_arc)
-        msp.delete_entity(circle)
-    print(f"Удалено CIRCLE: {len(circles_to_convert)}, создано ARC из них: {len(newly_created_arcs_from_circles)}")
+def half_circle_arcs(circle):
+    """
+    Возвращает dxfattribs двух дуг по 180 градусов, на которые разбивается круг.
+    Слой и цвет берутся из исходного круга.
+    """
+    # Сохраняем атрибуты оригинального круга для новых дуг
+    attribs = {}
+    if circle.dxf.hasattr("layer"):
+        attribs["layer"] = circle.dxf.layer
+    else:
+        attribs["layer"] = "0"  # Слой по умолчанию
+    if circle.dxf.hasattr("color"):
+        attribs["color"] = circle.dxf.color
+    # При необходимости можно добавить другие атрибуты
+
+    # Углы в градусах, против часовой стрелки от оси X
+    arcs = []
+    for i in range(2):  # Цикл дважды для двух дуг
+        start_angle_deg = i * 180.0
+        end_angle_deg = (i + 1) * 180.0
+        if end_angle_deg >= 360.0:
+            end_angle_deg = 359.9999  # FIX: избегаем исчезновения дуги
+
+        arc_attribs = dict(attribs)
+        arc_attribs.update(center=circle.dxf.center, radius=circle.dxf.radius,
+                           start_angle=start_angle_deg, end_angle=end_angle_deg)
+        arcs.append(arc_attribs)
+    return arcs
+
+
+def build_closed_chains(table, tol=1e-2):
+    """
+    Строит замкнутые цепочки по таблице сегментов SegmentTable.
 
-    # 2. Сбор всех объектов LINE и ARC для построения цепочек
-    # Этот запрос теперь включает оригинальные дуги и дуги, созданные из кругов
-    all_lines = list(msp.query("LINE"))
-    all_arcs = list(msp.query("ARC"))
-    all_entities = all_lines + all_arcs
+    Возвращает (final_chains, processed_entity_indices):
+    final_chains — список цепочек, каждая — список вершин (x, y, bulge_к_следующей_вершине)
+    без повторения начальной точки; processed_entity_indices — индексы сегментов, вошедших в цепочки.
+    """
+    # Координаты в виде списков Python: поэлементный доступ к ним быстрее, чем к массивам NumPy
+    x1, y1 = table.x1.tolist(), table.y1.tolist()
+    x2, y2 = table.x2.tolist(), table.y2.tolist()
+    bulge_forward, bulge_reverse = table.bulge_forward.tolist(), table.bulge_reverse.tolist()
 
-    print(f"Всего для обработки: {len(all_lines)} LINE, {len(all_arcs)} ARC. Суммарно: {len(all_entities)} объектов.")
+    # Индекс концевых точек строится один раз на файл
+    endpoint_index = EndpointIndex(tol)
+    for j in range(len(table)):
+        endpoint_index.add(j, (x1[j], y1[j]))
+        endpoint_index.add(j, (x2[j], y2[j]))
 
-    # 3. Построение цепочек (контуров)
     processed_entity_indices = set()  # Индексы объектов, уже включенных в финальные цепочки
     final_chains = []  # Список успешно построенных замкнутых цепочек
 
-    for i, current_entity in enumerate(all_entities):
+    for i in range(len(table)):
         if i in processed_entity_indices:
             continue
 
         # Начало новой цепочки
-        # Формат цепочки: список из (Vec3_вершина, bulge_от_этой_вершины_к_следующей)
-        current_chain_candidate = []
-
+        # Формат цепочки: список из (кортеж_вершины, bulge_от_этой_вершины_к_следующей)
         # Объекты (их индексы), использованные при текущей попытке построения цепочки
         # Они добавляются в processed_entity_indices только если цепочка финализирована
         temp_used_indices_for_this_chain = {i}
-
-        # Инициализация первого сегмента цепочки
-        p1_vec, p2_vec = None, None  # Vec3
-        bulge_for_first_segment = 0.0
-
-        if current_entity.dxftype() == "LINE":
-            p1_vec = Vec3(current_entity.dxf.start)  # Гарантируем Vec3
-            p2_vec = Vec3(current_entity.dxf.end)
-            bulge_for_first_segment = 0.0
-        else:  # ARC
-            p1_vec = Vec3(current_entity.start_point)
-            p2_vec = Vec3(current_entity.end_point)
-            center_vec = Vec3(current_entity.dxf.center)
-            # Конвертируем в кортежи для arc_bulge
-            p1_tuple = (p1_vec.x, p1_vec.y)
-            p2_tuple = (p2_vec.x, p2_vec.y)
-            center_tuple = (center_vec.x, center_vec.y)
-            bulge_for_first_segment = arc_bulge(p1_tuple, p2_tuple, center_tuple)
-
-        current_chain_candidate.append((p1_vec, bulge_for_first_segment))
-        current_chain_candidate.append((p2_vec, None))  # Bulge от p2_vec изначально неизвестен
+        chain_start_tuple = (x1[i], y1[i])
+        current_chain_candidate = [(chain_start_tuple, bulge_forward[i])]
+        chain_tip_vertex_tuple = (x2[i], y2[i])  # Bulge от конца цепочки пока неизвестен
 
         # Пытаемся расширить цепочку
-        chain_extended_in_iteration = True
-        while chain_extended_in_iteration:
-            chain_extended_in_iteration = False
-
-            # Конечная точка текущей попытки построения цепочки (последняя добавленная вершина)
-            chain_tip_vertex_vec = current_chain_candidate[-1][0]
-            chain_tip_vertex_tuple = (chain_tip_vertex_vec.x, chain_tip_vertex_vec.y)
-
+        while True:
             # Проверяем, не замкнулась ли цепочка (последняя точка близка к начальной)
-            if len(current_chain_candidate) > 2:  # Нужно как минимум 2 сегмента для замыкания
-                if is_close(chain_tip_vertex_tuple, (current_chain_candidate[0][0].x, current_chain_candidate[0][0].y),
-                            tol):
+            if len(current_chain_candidate) > 1:  # Нужно как минимум 2 сегмента для замыкания
+                if is_close(chain_tip_vertex_tuple, chain_start_tuple, tol):
                     break  # Цепочка замкнулась, прекращаем её расширение
 
-            for j, next_entity in enumerate(all_entities):
-                if j in temp_used_indices_for_this_chain:  # Уже использован в этой цепочке
-                    continue
-
-                next_e_p1_vec, next_e_p2_vec, next_e_center_vec = None, None, None
-                next_e_is_arc = False
-
-                if next_entity.dxftype() == "LINE":
-                    next_e_p1_vec = Vec3(next_entity.dxf.start)
-                    next_e_p2_vec = Vec3(next_entity.dxf.end)
-                else:  # ARC
-                    next_e_p1_vec = Vec3(next_entity.start_point)
-                    next_e_p2_vec = Vec3(next_entity.end_point)
-                    next_e_center_vec = Vec3(next_entity.dxf.center)
-                    next_e_is_arc = True
-
-                next_e_p1_tuple = (next_e_p1_vec.x, next_e_p1_vec.y)
-                next_e_p2_tuple = (next_e_p2_vec.x, next_e_p2_vec.y)
-
-                # Пытаемся соединить chain_tip_vertex_tuple с next_e_p1_tuple или next_e_p2_tuple
-                connected_new_endpoint_vec = None
-                calculated_bulge_for_chain_tip = 0.0
-
-                # Порядок точек для bulge: от chain_tip_vertex_tuple к новой конечной точке
-                if is_close(chain_tip_vertex_tuple, next_e_p1_tuple, tol):
-                    # Соединение: chain_tip -> next_e_p1 -> next_e_p2
-                    # Добавляемый сегмент: от chain_tip (эффективно next_e_p1) к next_e_p2
-                    connected_new_endpoint_vec = next_e_p2_vec
-                    if next_e_is_arc:
-                        center_tuple = (next_e_center_vec.x, next_e_center_vec.y)
-                        calculated_bulge_for_chain_tip = arc_bulge(next_e_p1_tuple, next_e_p2_tuple, center_tuple)
-                    else:  # Линия
-                        calculated_bulge_for_chain_tip = 0.0
-
-                elif is_close(chain_tip_vertex_tuple, next_e_p2_tuple, tol):
-                    # Соединение: chain_tip -> next_e_p2 -> next_e_p1
-                    # Добавляемый сегмент: от chain_tip (эффективно next_e_p2) к next_e_p1
-                    connected_new_endpoint_vec = next_e_p1_vec
-                    if next_e_is_arc:
-                        center_tuple = (next_e_center_vec.x, next_e_center_vec.y)
-                        calculated_bulge_for_chain_tip = arc_bulge(next_e_p2_tuple, next_e_p1_tuple, center_tuple)
-                    else:  # Линия
-                        calculated_bulge_for_chain_tip = 0.0
-
-                if connected_new_endpoint_vec is not None:
-                    # Найдено соединение
-                    # Обновляем bulge текущей последней точки в current_chain_candidate
-                    current_chain_candidate[-1] = (chain_tip_vertex_vec, calculated_bulge_for_chain_tip)
-
-                    # Добавляем новую конечную точку
-                    current_chain_candidate.append((connected_new_endpoint_vec, None))  # Bulge для неё пока неизвестен
-
-                    temp_used_indices_for_this_chain.add(j)
-                    chain_extended_in_iteration = True
-                    break  # Перезапускаем поиск следующего сегмента от новой конечной точки цепочки
-
-            # После итерации по всем all_entities, если chain_extended_in_iteration == False, внутренний цикл while завершается.
-
-        # Попытка расширения цепочки завершена. Проверяем замыкание.
-        # Последняя добавленная точка: current_chain_candidate[-1][0].
-        # Первая точка цепочки: current_chain_candidate[0][0].
-        chain_start_vec = current_chain_candidate[0][0]
-        chain_end_vec = current_chain_candidate[-1][0]  # Это (потенциально) замыкающая точка
-
-        # Замкнутая цепочка должна иметь как минимум 2 сегмента.
-        # Это значит, что current_chain_candidate будет содержать 3 элемента: (P1,b1), (P2,b2_to_P1), (P1_дубликат, None)
-        if len(current_chain_candidate) > 2 and \
-                is_close((chain_start_vec.x, chain_start_vec.y), (chain_end_vec.x, chain_end_vec.y), tol):
-            # Цепочка замкнута. Добавляем в final_chains.
-            # Bulge для замыкающего сегмента (от current_chain_candidate[-2][0] к chain_start_vec)
-            # должен был быть установлен, когда chain_end_vec (дубликат chain_start_vec) был добавлен.
-            final_chains.append(list(current_chain_candidate))  # Сохраняем копию
+            # Ищем через индекс сегмент с наименьшим номером, касающийся конца цепочки
+            j = endpoint_index.find_nearest_segment(chain_tip_vertex_tuple, temp_used_indices_for_this_chain)
+            if j is None:
+                break  # Продолжения нет
+
+            # Порядок точек для bulge: от chain_tip_vertex_tuple к новой конечной точке
+            if is_close(chain_tip_vertex_tuple, (x1[j], y1[j]), tol):
+                # Соединение: chain_tip -> next_e_p1 -> next_e_p2
+                current_chain_candidate.append((chain_tip_vertex_tuple, bulge_forward[j]))
+                chain_tip_vertex_tuple = (x2[j], y2[j])
+            else:
+                # Соединение: chain_tip -> next_e_p2 -> next_e_p1
+                current_chain_candidate.append((chain_tip_vertex_tuple, bulge_reverse[j]))
+                chain_tip_vertex_tuple = (x1[j], y1[j])
+
+            temp_used_indices_for_this_chain.add(j)
+
+        # Замкнутая цепочка должна иметь как минимум 2 сегмента
+        if len(current_chain_candidate) > 1 and is_close(chain_start_tuple, chain_tip_vertex_tuple, tol):
+            final_chains.append([(x, y, bulge) for (x, y), bulge in current_chain_candidate])
             processed_entity_indices.update(temp_used_indices_for_this_chain)  # Помечаем объекты как использованные
         # else: Цепочка не замкнута или слишком коротка, отбрасываем эту попытку.
-        # Объекты из temp_used_indices_for_this_chain (если не добавлены в processed_entity_indices)
-        # будут доступны для начала новых цепочек или расширения других.
+        # Объекты из temp_used_indices_for_this_chain будут доступны для начала новых цепочек или расширения других.
+
+    return final_chains, processed_entity_indices
+
+
+def split_isolated_circles(segment_table, circle_arc_table, tol=1e-2):
+    """
+    Отделяет круги, не касающиеся другой геометрии: такой круг уже сам по себе замкнутый контур,
+    и в общий поиск цепочек его дуги передавать незачем.
+
+    circle_arc_table — дуги из кругов (half_circle_arcs), по две подряд на круг.
+    Круг изолирован, если ни один конец других сегментов и дуг других кругов не лежит в пределах tol
+    от концов его дуг, а цепочка из двух дуг замыкается. Для него контур получается тем же,
+    что построил бы build_closed_chains: [(начало 1-й дуги, bulge), (начало 2-й дуги, bulge)].
+
+    Сначала векторно по ячейкам сетки EndpointIndex отбираются круги, рядом с которыми нет чужих точек;
+    точная проверка через EndpointIndex выполняется только для остальных.
+    Возвращает (контуры изолированных кругов, индексы их дуг, индексы дуг остальных кругов).
+    """
+    x1, y1 = circle_arc_table.x1.tolist(), circle_arc_table.y1.tolist()
+    x2, y2 = circle_arc_table.x2.tolist(), circle_arc_table.y2.tolist()
+    bulge_forward = circle_arc_table.bulge_forward.tolist()
+    circle_count = len(circle_arc_table) // 2
+
+    # Точки круга: начало и конец 1-й дуги, начало и конец 2-й дуги
+    point_xs = np.stack([circle_arc_table.x1[0::2], circle_arc_table.x2[0::2],
+                         circle_arc_table.x1[1::2], circle_arc_table.x2[1::2]], axis=1)
+    point_ys = np.stack([circle_arc_table.y1[0::2], circle_arc_table.y2[0::2],
+                         circle_arc_table.y1[1::2], circle_arc_table.y2[1::2]], axis=1)
+    point_cx, point_cy = grid_cells(point_xs, point_ys, tol)
+    own_keys = cell_key(point_cx, point_cy)  # круг x 4 точки
+    segment_keys = [cell_key(*grid_cells(xs, ys, tol)) for xs, ys in ((segment_table.x1, segment_table.y1),
+                                                                       (segment_table.x2, segment_table.y2))]
+
+    # Сколько точек в каждой ячейке всего и сколько из них принадлежат самому кругу
+    cell_keys, cell_counts = np.unique(np.concatenate(segment_keys + [own_keys.ravel()]), return_counts=True)
+    neighbour_keys = cell_key(point_cx[:, :, None] + NEIGHBOUR_DX, point_cy[:, :, None] + NEIGHBOUR_DY)
+    positions = np.minimum(np.searchsorted(cell_keys, neighbour_keys), len(cell_keys) - 1)
+    total = np.where(cell_keys[positions] == neighbour_keys, cell_counts[positions], 0) if len(cell_keys) else 0
+    own = (neighbour_keys[:, :, :, None] == own_keys[:, None, None, :]).sum(axis=3)
+    crowded = ((total - own) > 0).any(axis=(1, 2)).tolist()
+
+    # Точная проверка кругов, рядом с которыми есть чужие точки. Изолированные круги не могут касаться
+    # проверяемых (касание видно из обоих кругов), поэтому в индекс идут только концы сегментов
+    # рядом с проверяемыми кругами и дуги самих проверяемых кругов; номер дуги k — first_arc + k
+    crowded_circles = np.flatnonzero(crowded)
+    endpoint_index = EndpointIndex(tol)
+    if len(crowded_circles):
+        crowded_keys = neighbour_keys[crowded_circles].ravel()
+        for (xs, ys), keys in zip(((segment_table.x1, segment_table.y1), (segment_table.x2, segment_table.y2)),
+                                  segment_keys):
+            for j in np.flatnonzero(np.isin(keys, crowded_keys)).tolist():
+                endpoint_index.add(j, (float(xs[j]), float(ys[j])))
+    first_arc = len(segment_table)
+    for c in crowded_circles.tolist():
+        for k in (2 * c, 2 * c + 1):
+            endpoint_index.add(first_arc + k, (x1[k], y1[k]))
+            endpoint_index.add(first_arc + k, (x2[k], y2[k]))
+
+    isolated_chains, isolated_arcs, shared_arcs = [], set(), []
+    for c in range(circle_count):
+        k = 2 * c
+        start, middle, end = (x1[k], y1[k]), (x2[k], y2[k]), (x2[k + 1], y2[k + 1])
+        own_arcs = {first_arc + k, first_arc + k + 1}
+        if is_close(end, start, tol) and (not crowded[c] or all(
+                endpoint_index.find_nearest_segment(point, own_arcs) is None for point in (start, middle, end))):
+            isolated_chains.append([(x1[k], y1[k], bulge_forward[k]), (x1[k + 1], y1[k + 1], bulge_forward[k + 1])])
+            isolated_arcs.update((k, k + 1))
+        else:
+            shared_arcs += [k, k + 1]
+    return isolated_chains, isolated_arcs, shared_arcs
+
+
+def build_contours(segment_table, circle_arc_table, tol=1e-2):
+    """
+    Замкнутые контуры из сегментов LINE/ARC и дуг кругов.
+    Изолированные круги превращаются в контуры напрямую (split_isolated_circles), в build_closed_chains
+    передаются только сегменты и круги, касающиеся другой геометрии. Контуры изолированных кругов
+    идут после остальных.
+
+    Возвращает (final_chains, использованные индексы segment_table, использованные индексы circle_arc_table).
+    """
+    isolated_chains, processed_circle_arcs, shared_arcs = split_isolated_circles(segment_table, circle_arc_table,
+                                                                                 tol)
+    table = SegmentTable.concat(segment_table, circle_arc_table.take(shared_arcs))
+    final_chains, processed = build_closed_chains(table, tol)
+
+    first_arc = len(segment_table)
+    processed_segments = {idx for idx in processed if idx < first_arc}
+    processed_circle_arcs.update(shared_arcs[idx - first_arc] for idx in processed if idx >= first_arc)
+    return final_chains + isolated_chains, processed_segments, processed_circle_arcs
+
+
+def referenced_blocks(doc):
+    """
+    Имена определений блоков, на которые ссылаются INSERT пространства модели, включая вложенные INSERT
+    внутри самих блоков. Каждый блок встречается один раз, сколько бы вставок на него ни было.
+    Внешние ссылки (XREF) пропускаются: их геометрия хранится в другом файле.
+    """
+    names = []
+    seen = set()
+    pending = [doc.modelspace()]
+    while pending:
+        layout = pending.pop(0)
+        for insert in layout.query("INSERT"):
+            name = insert.dxf.name
+            if name in seen:
+                continue
+            seen.add(name)
+            block_layout = doc.blocks.get(name)
+            if block_layout is None or block_layout.block.is_xref:
+                continue
+            names.append(name)
+            pending.append(block_layout)
+    return names
+
+
+def convert_document(doc, tol=1e-2, metrics=None, blocks=False, depth_layers=False):
+    """
+    Конвертирует загруженный документ на месте, объединяя LINE, ARC и CIRCLE в замкнутые LWPOLYLINE с bulge.
+    Круги разбиваются на две дуги по 180 градусов.
+    metrics — необязательный ConversionMetrics для времени по этапам и счётчиков.
+    blocks — конвертировать также определения блоков, на которые ссылаются INSERT. Каждое определение
+    конвертируется один раз, вставки остаются на месте и показывают уже сконвертированную геометрию.
+    depth_layers — раскладывать контуры по слоям по глубине вложенности (contour_layer).
+    """
+    metrics = metrics if metrics is not None else ConversionMetrics()
+    convert_layout(doc.modelspace(), tol, metrics, depth_layers)
+
+    if blocks:
+        for name in referenced_blocks(doc):
+            print(f"Блок {name}:")
+            convert_layout(doc.blocks.get(name), tol, metrics, depth_layers)
+            metrics.count("blocks")
+
+    # Метка конвертера в HEADER: повторная обработка этого файла будет пропущена без разбора чертежа.
+    # Пользовательские переменные HEADER поддерживаются начиная с DXF R2004, для более старых версий метки нет.
+    # В метку входит $HANDSEED сохраняемого файла: новые объекты, добавленные в чертёж позже, его увеличивают,
+    # и такой файл уже не считается сконвертированным. update_all() заранее создаёт служебные объекты,
+    # которые ezdxf иначе добавил бы при записи
+    doc.update_all()
+    marker = converter_marker(tol, blocks, depth_layers, str(doc.entitydb.handles))
+    if doc.header.custom_vars.has_tag(CONVERTER_MARKER_TAG):
+        doc.header.custom_vars.replace(CONVERTER_MARKER_TAG, marker)
+    else:
+        doc.header.custom_vars.append(CONVERTER_MARKER_TAG, marker)
+
+
+def convert_layout(layout, tol=1e-2, metrics=None, depth_layers=False):
+    """
+    Конвертирует на месте одно пространство документа: пространство модели или определение блока.
+    Контуры записываются в порядке резки (contour_order.order_contours).
+    """
+    metrics = metrics if metrics is not None else ConversionMetrics()
+    metrics.count("entities_in", len(layout))
+
+    # Изменения пространства копятся и применяются одним проходом в конце (поштучное удаление — O(n) на объект)
+    edits = LayoutEditBatch(layout)
+
+    # 1. Конвертация CIRCLE (Кругов) в ARC (Дуги)
+    # Дуги из кругов пока существуют только как атрибуты: в чертёж попадут лишь не вошедшие в контуры
+    with metrics.stage("circles"):
+        circles_to_convert = list(layout.query("CIRCLE"))  # Материализуем запрос перед изменением пространства
+        print(f"Найдено исходных CIRCLE: {len(circles_to_convert)}")
+
+        arcs_from_circles = []  # dxfattribs дуг, полученных из кругов
+        for circle in circles_to_convert:
+            arcs_from_circles += half_circle_arcs(circle)
+            edits.delete(circle)
+    metrics.count("circles", len(circles_to_convert))
+    print(f"Удалено CIRCLE: {len(circles_to_convert)}, создано ARC из них: {len(arcs_from_circles)}")
+
+    # 2. Сбор всех объектов LINE и ARC для построения цепочек
+    # Дуги из кругов идут после остальных ARC — в том же порядке, в каком они добавлялись бы в пространство
+    with metrics.stage("extract"):
+        all_lines = list(layout.query("LINE"))
+        all_arcs = list(layout.query("ARC"))
+        all_entities = all_lines + all_arcs
+        segment_table = SegmentTable.from_entities(all_entities)
+        circle_arc_table = SegmentTable.from_rows(segment_row(Arc.new(dxfattribs=arc_attribs))
+                                                  for arc_attribs in arcs_from_circles)
+    segments_total = len(segment_table) + len(circle_arc_table)
+    metrics.count("segments", segments_total)
+
+    print(f"Всего для обработки: {len(all_lines)} LINE, {len(all_arcs) + len(arcs_from_circles)} ARC. "
+          f"Суммарно: {segments_total} объектов.")
+
+    # 3. Построение цепочек (контуров); круги, не касающиеся другой геометрии, становятся контурами сразу
+    with metrics.stage("chaining"):
+        final_chains, processed_segments, processed_circle_arcs = build_contours(segment_table, circle_arc_table,
+                                                                                 tol)
+    processed_total = len(processed_segments) + len(processed_circle_arcs)
+    metrics.count("chains", len(final_chains))
+    metrics.count("unclosed_leftovers", segments_total - processed_total)
 
     print(f"Найдено замкнутых контуров: {len(final_chains)}")
 
     # 4. Удаление использованных оригинальных объектов, которые теперь являются частью цепочек
-    entities_to_delete = []
-    # Собираем объекты для удаления по их индексам из all_entities
-    for idx in sorted(list(processed_entity_indices), reverse=True):
-        entities_to_delete.append(all_entities[idx])
-
-    for ent_to_del in entities_to_delete:
-        if ent_to_del.is_alive:  # Проверяем, существует ли объект еще в чертеже
-            try:
-                msp.delete_entity(ent_to_del)
-            except ezdxf.DXFTypeError:
-                # Это может произойти, если объект уже был удален (например, исходный CIRCLE)
-                print(f"Предупреждение: Не удалось удалить объект {ent_to_del.dxf.handle}, возможно, уже удален.")
-    print(f"Удалено использованных объектов LINE/ARC: {len(entities_to_delete)}")
-
-    # 5. Добавление LWPOLYLINE для найденных цепочек
-    for chain_idx, complete_chain in enumerate(final_chains):
-        vertices_for_lwpolyline = []
-        # complete_chain имеет вид [(v1,b1), (v2,b2), ..., (vk, bk_to_v1), (v1_дубликат, None)]
-        # Нам нужны точки v1, v2, ..., vk с их соответствующими bulge b1, b2, ..., bk_to_v1.
-        # Поэтому итерируем до предпоследнего элемента complete_chain.
-        for i in range(len(complete_chain) - 1):
-            point_vec = complete_chain[i][0]
-            bulge_val = complete_chain[i][1]
-
-            if bulge_val is None:
-                # Этого не должно происходить для сегментов в завершенной цепочке, кроме bulge последнего элемента-заполнителя.
-                # Однако, диапазон цикла len(complete_chain)-1 уже исключает этот последний элемент.
-                # Если это произошло, значит bulge сегмента не был вычислен. По умолчанию ставим 0.
-                print(f"Предупреждение: Обнаружен None bulge в цепочке {chain_idx}, вершина {i}. Используется 0.")
-                bulge_val = 0.0
-
-            vertices_for_lwpolyline.append((point_vec.x, point_vec.y, bulge_val))
-
-        if vertices_for_lwpolyline:
+    with metrics.stage("delete"):
+        for idx in processed_segments:
+            edits.delete(all_entities[idx])
+    print(f"Удалено использованных объектов LINE/ARC: {processed_total}")
+
+    # 5. Порядок резки: вложенные контуры раньше охватывающих, соседние — по ближайшему соседу
+    with metrics.stage("nesting"):
+        ordered_chains = order_contours(final_chains)
+    metrics.count("nested_contours", sum(1 for _, depth in ordered_chains if depth))
+
+    # 6. Добавление оставшихся дуг из кругов и LWPOLYLINE для найденных цепочек
+    # Каждая цепочка уже имеет вид [(x1, y1, b1), ..., (xk, yk, bk_to_v1)] — вершины без дубликата начальной
+    with metrics.stage("insert"):
+        for k, arc_attribs in enumerate(arcs_from_circles):
+            if k not in processed_circle_arcs:  # Дуги из кругов в чертёж не добавлялись
+                edits.add("ARC", arc_attribs)
+        for vertices_for_lwpolyline, depth in ordered_chains:
             # Добавляем LWPolyline (легковесную полилинию)
-            lw = msp.add_lwpolyline(
+            edits.add_lwpolyline(
                 points=vertices_for_lwpolyline,
                 format='xyb',  # Формат точек: x, y, bulge
                 close=True,  # Помечаем полилинию как замкнутую
-                dxfattribs={"layer": "CUT"}  # Назначаем слой "CUT"
+                dxfattribs={"layer": contour_layer(depth, depth_layers)}  # Слой "CUT" (или по глубине)
             )
-        else:
-            print(f"Предупреждение: Цепочка {chain_idx} пуста, LWPOLYLINE не создан.")
 
-    doc.saveas(output_path)
+    with metrics.stage("apply"):
+        edits.apply()
+
+
+def convert_dxf_with_bulge(input_path, output_path, tol=1e-2, metrics=None, blocks=False, depth_layers=False):
+    """
+    Конвертирует DXF файл, объединяя LINE, ARC и CIRCLE в замкнутые LWPOLYLINE с bulge.
+    Круги разбиваются на две дуги по 180 градусов.
+    metrics — необязательный ConversionMetrics для времени по этапам и счётчиков.
+    blocks, depth_layers — режимы конвертации (см. convert_document).
+    """
+    metrics = metrics if metrics is not None else ConversionMetrics(str(input_path))
+    print(f"Чтение файла: {input_path}")
+    try:
+        with metrics.stage("readfile"):
+            doc = ezdxf.readfile(input_path)
+    except IOError:
+        print(f"Не удалось открыть файл: {input_path}")
+        return
+    except ezdxf.DXFStructureError:
+        print(f"Ошибка структуры DXF файла: {input_path}")
+        return
+    metrics.count("bytes_read", os.path.getsize(input_path))
+
+    convert_document(doc, tol, metrics, blocks, depth_layers)
+
+    with metrics.stage("saveas"):
+        doc.saveas(output_path)
+    metrics.count("bytes_written", os.path.getsize(output_path))
     print(f"Сохранено как: {output_path}")
 
 
+def read_dxf_bytes(data):
+    """
+    Загружает документ из содержимого DXF файла (bytes). Кодировка определяется по HEADER, как в ezdxf.readfile.
+    Бинарный DXF не поддерживается.
+    """
+    if data.startswith(b"AutoCAD Binary DXF"):
+        raise ezdxf.DXFStructureError("Бинарный DXF не поддерживается при чтении из памяти")
+    text = data.replace(b"\r\n", b"\n")
+    info = dxf_stream_info(io.StringIO(text.decode("utf-8", errors="ignore")))
+    return ezdxf.read(io.StringIO(text.decode(info.encoding, errors="surrogateescape")))
+
+
+def convert_dxf_bytes(data, tol=1e-2, metrics=None, blocks=False, depth_layers=False):
+    """
+    Конвертация в памяти: принимает содержимое DXF файла (bytes) и возвращает содержимое результата.
+    В отличие от convert_dxf_with_bulge, ошибки чтения не подавляются (ezdxf.DXFStructureError).
+    """
+    metrics = metrics if metrics is not None else ConversionMetrics()
+    with metrics.stage("readfile"):
+        doc = read_dxf_bytes(data)
+    metrics.count("bytes_read", len(data))
+
+    convert_document(doc, tol, metrics, blocks, depth_layers)
+
+    with metrics.stage("saveas"):
+        stream = io.StringIO()
+        doc.write(stream)
+        output = doc.encode(stream.getvalue())
+    metrics.count("bytes_written", len(output))
+    return output
+
+
 # --- Пример использования ---
 if __name__ == "__main__":
     # При необходимости создайте фиктивный DXF для тестирования
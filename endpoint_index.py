@@ -0,0 +1,68 @@
+import math
+
+import numpy as np
+
+
+class EndpointIndex:
+    """
+    Хеш-сетка концевых точек сегментов для быстрого поиска соседей при построении цепочек.
+
+    Размер ячейки равен допуску tol, поэтому все точки на расстоянии <= tol от искомой
+    лежат в ячейке запроса или в одной из 8 соседних. Индекс строится один раз на файл.
+    """
+
+    def __init__(self, tol=1e-2):
+        self.tol = tol
+        # При tol == 0 берём минимальный положительный размер ячейки, чтобы не делить на ноль
+        self.cell_size = tol if tol > 0 else 1e-9
+        self._cells = {}  # (cx, cy) -> список (индекс_сегмента, x, y)
+
+    def _cell(self, x, y):
+        return math.floor(x / self.cell_size), math.floor(y / self.cell_size)
+
+    def add(self, segment_index, point):
+        x, y = point[0], point[1]
+        self._cells.setdefault(self._cell(x, y), []).append((segment_index, x, y))
+
+    def find_nearest_segment(self, point, exclude=()):
+        """
+        Возвращает наименьший индекс сегмента, у которого хотя бы один конец находится
+        в пределах tol от point (в 2D), либо None. Индексы из exclude пропускаются.
+        Наименьший индекс сохраняет порядок перебора исходного линейного поиска.
+        """
+        x, y = point[0], point[1]
+        cx, cy = self._cell(x, y)
+        best = None
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                for segment_index, px, py in self._cells.get((cx + dx, cy + dy), ()):
+                    if best is not None and segment_index >= best:
+                        continue
+                    if segment_index in exclude:
+                        continue
+                    if math.dist((x, y), (px, py)) <= self.tol:
+                        best = segment_index
+        return best
+
+
+
+# Смещения соседних ячеек (включая саму ячейку) для векторных проверок
+NEIGHBOUR_DX = np.array([-1, -1, -1, 0, 0, 0, 1, 1, 1], dtype=np.int64)
+NEIGHBOUR_DY = np.array([-1, 0, 1, -1, 0, 1, -1, 0, 1], dtype=np.int64)
+
+
+def grid_cells(xs, ys, tol=1e-2):
+    """Векторный аналог EndpointIndex._cell: номера ячеек (cx, cy) для массивов координат."""
+    cell_size = tol if tol > 0 else 1e-9
+    with np.errstate(invalid="ignore"):
+        return (np.floor(np.asarray(xs) / cell_size).astype(np.int64),
+                np.floor(np.asarray(ys) / cell_size).astype(np.int64))
+
+
+def cell_key(cx, cy):
+    """
+    Код ячейки (cx, cy) одним int64 для np.unique/np.isin. На огромных координатах коды разных ячеек
+    могут совпасть — это даёт только лишних кандидатов, которые отсеивает точная проверка.
+    """
+    with np.errstate(over="ignore"):
+        return cx * 4294967296 + cy
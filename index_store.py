@@ -0,0 +1,124 @@
+import os
+import sqlite3
+import time
+from pathlib import Path
+
+from process_dxf_utils import file_hash, read_index
+
+FIELDS = ("size", "mtime", "content_hash", "converter_version", "tol", "duration", "outcome", "error",
+          "failures", "retry_at", "failed_mtime")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    size INTEGER,
+    mtime REAL,
+    content_hash TEXT,
+    converter_version TEXT,
+    tol REAL,
+    duration REAL,
+    outcome TEXT,
+    error TEXT,
+    failures INTEGER,
+    retry_at REAL,
+    failed_mtime REAL,
+    updated_at REAL
+)
+"""
+
+# Версия конвертера для записей, перенесённых из index.json: какой версией получены эти файлы, неизвестно
+LEGACY_CONVERTER_VERSION = "legacy"
+
+# Колонки, добавленные после первой версии схемы: в существующую базу добавляются при открытии
+ADDED_COLUMNS = {"failures": "INTEGER", "retry_at": "REAL", "failed_mtime": "REAL"}
+
+
+class IndexStore:
+    """
+    Индекс обработанных файлов в SQLite (режим WAL), ключ — путь относительно INPUT_DIR.
+
+    Для каждого файла хранится состояние уже сконвертированного файла на диске (размер, mtime,
+    хеш содержимого), версия конвертера и допуск, с которыми он получен, время и результат обработки.
+    После ошибок — число ошибок подряд, время следующей попытки и mtime файла, на котором была ошибка.
+    Изменения записываются построчно (upsert), без перезаписи всего индекса.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._conn = sqlite3.connect(db_path)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(SCHEMA)
+        existing = {row[1] for row in self._conn.execute("PRAGMA table_info(files)")}
+        for name, column_type in ADDED_COLUMNS.items():
+            if name not in existing:
+                self._conn.execute(f"ALTER TABLE files ADD COLUMN {name} {column_type}")
+        self._conn.commit()
+
+    def close(self):
+        self._conn.close()
+
+    def get(self, path):
+        row = self._conn.execute("SELECT * FROM files WHERE path = ?", (path,)).fetchone()
+        return dict(row) if row is not None else None
+
+    def paths(self):
+        return [row[0] for row in self._conn.execute("SELECT path FROM files")]
+
+    def is_empty(self):
+        return self._conn.execute("SELECT 1 FROM files LIMIT 1").fetchone() is None
+
+    def upsert(self, path, **fields):
+        """Вставляет или обновляет запись; обновляются только переданные поля."""
+        unknown = set(fields) - set(FIELDS)
+        if unknown:
+            raise ValueError(f"Неизвестные поля индекса: {', '.join(sorted(unknown))}")
+        fields["updated_at"] = time.time()
+        columns = ", ".join(fields)
+        placeholders = ", ".join("?" for _ in fields)
+        updates = ", ".join(f"{name} = excluded.{name}" for name in fields)
+        with self._conn:
+            self._conn.execute(
+                f"INSERT INTO files (path, {columns}) VALUES (?, {placeholders}) "
+                f"ON CONFLICT(path) DO UPDATE SET {updates}",
+                (path, *fields.values()),
+            )
+
+    def delete(self, path):
+        with self._conn:
+            self._conn.execute("DELETE FROM files WHERE path = ?", (path,))
+
+    def import_json(self, index_json, root, tol):
+        """
+        Однократный перенос старого index.json (путь -> mtime) в базу.
+
+        В index.json нет версии конвертера, поэтому записи помечаются LEGACY_CONVERTER_VERSION и при
+        ближайшей сверке файлы проверяются заново: уже сконвертированные текущей версией распознаются
+        по метке в HEADER без повторной конвертации. Для файлов, чей mtime совпадает с записанным,
+        сразу сохраняются размер и хеш. Возвращает число перенесённых записей.
+        """
+        legacy_index = read_index(index_json)
+        imported = 0
+        for rel_path, mtime in legacy_index.items():
+            fields = {"mtime": mtime, "converter_version": LEGACY_CONVERTER_VERSION, "tol": tol, "outcome": "imported"}
+            file_path = Path(root) / rel_path
+            try:
+                stat = file_path.stat()
+                if stat.st_mtime == mtime:
+                    fields["size"] = stat.st_size
+                    fields["content_hash"] = file_hash(file_path)
+            except OSError:
+                pass  # Файла уже нет: запись удалится при ближайшей полной сверке
+            self.upsert(rel_path, **fields)
+            imported += 1
+        return imported
+
+
+def open_index_store(db_path, index_json, root, tol):
+    """Открывает базу индекса; при первом запуске переносит в неё данные из index_json."""
+    store = IndexStore(db_path)
+    if store.is_empty() and os.path.exists(index_json):
+        imported = store.import_json(index_json, root, tol)
+        print(f"📦 Перенесено записей из {index_json} в {db_path}: {imported}")
+    return store
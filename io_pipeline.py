@@ -0,0 +1,97 @@
+from concurrent.futures import ALL_COMPLETED, FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+
+
+class Prefetcher:
+    """
+    Чтение файлов наперёд: пока конвертируются текущие файлы, пул потоков читает в память следующие
+    по очереди. На сетевой папке (SMB) процессы конвертации тогда не простаивают в ожидании чтения.
+
+    В памяти держится не больше max_files файлов, файлы больше max_file_size не читаются
+    (их конвертирует потоковый режим прямо с диска).
+    """
+
+    def __init__(self, threads, max_files, max_file_size):
+        self.max_files = max_files
+        self.max_file_size = max_file_size
+        self._executor = ThreadPoolExecutor(max(1, threads), thread_name_prefix="dxf-prefetch")
+        self._pending = {}  # Path -> Future((size, mtime_ns), bytes) или None
+
+    def _read(self, path: Path):
+        stat = path.stat()
+        if stat.st_size > self.max_file_size:
+            return None
+        return (stat.st_size, stat.st_mtime_ns), path.read_bytes()
+
+    def prefetch(self, paths):
+        """
+        Начинает чтение paths — ближайших файлов очереди по порядку. Прочитанные ранее файлы, которых
+        в paths больше нет (очередь изменилась), забываются, чтобы не занимать память.
+        """
+        upcoming = list(paths)[:self.max_files]
+        for path in list(self._pending):
+            if path not in upcoming:
+                self._pending.pop(path).cancel()
+        for path in upcoming:
+            if path not in self._pending:
+                self._pending[path] = self._executor.submit(self._read, path)
+
+    def take(self, path: Path):
+        """
+        (содержимое, (размер, mtime_ns) на момент чтения), если файл прочитан заранее и с тех пор
+        не менялся, иначе None — тогда файл читается обычным образом.
+        """
+        future = self._pending.pop(path, None)
+        if future is None:
+            return None
+        try:
+            result = future.result()
+            stat = path.stat()
+        except OSError:
+            return None
+        if result is None:
+            return None
+        state, data = result
+        return (data, state) if state == (stat.st_size, stat.st_mtime_ns) else None
+
+    def close(self):
+        for future in self._pending.values():
+            future.cancel()
+        self._pending.clear()
+        self._executor.shutdown(wait=True)
+
+
+class WriteBehind:
+    """
+    Отложенная запись результатов: запись на диск выполняется пулом потоков, пока конвертируются
+    следующие файлы. submit() ставит задачу, collect() отдаёт завершённые как (context, ok, result),
+    при ok == False в result текст ошибки. Если задач больше max_pending, collect() ждёт завершения
+    хотя бы одной — так запись не отстаёт от конвертации без предела.
+    """
+
+    def __init__(self, threads, max_pending):
+        self.max_pending = max(1, max_pending)
+        self._executor = ThreadPoolExecutor(max(1, threads), thread_name_prefix="dxf-write")
+        self._futures = {}  # Future -> context
+
+    def __len__(self):
+        return len(self._futures)
+
+    def submit(self, context, func, *args):
+        self._futures[self._executor.submit(func, *args)] = context
+
+    def collect(self, wait_all=False):
+        """Завершённые задачи; wait_all — дождаться всех поставленных."""
+        if self._futures and (wait_all or len(self._futures) >= self.max_pending):
+            wait(list(self._futures), return_when=ALL_COMPLETED if wait_all else FIRST_COMPLETED)
+        finished = []
+        for future in [future for future in self._futures if future.done()]:
+            context = self._futures.pop(future)
+            try:
+                finished.append((context, True, future.result()))
+            except Exception as e:
+                finished.append((context, False, str(e) or repr(e)))
+        return finished
+
+    def close(self):
+        self._executor.shutdown(wait=True)
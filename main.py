@@ -1,56 +1,616 @@
+import hashlib
+import multiprocessing
+import os
+import signal
 import time
-import shutil
 from tempfile import NamedTemporaryFile
 from pathlib import Path
 
-from constants import INDEX_JSON, INPUT_DIR, DELAY_BETWEEN_FILES, CHECK_INTERVAL
-from convert_dxf import convert_dxf_with_bulge
-from process_dxf_utils import get_all_dxf_files, read_index, write_index_safely
+from constants import (INDEX_JSON, INDEX_DB, INPUT_DIR, CONVERT_TOL, DELAY_BETWEEN_FILES, CHECK_INTERVAL, MAX_WORKERS,
+                       FILE_TIMEOUT, WATCH_MODE, WATCH_DEBOUNCE, RECONCILE_INTERVAL, STREAMING_MIN_SIZE, METRICS_LOG,
+                       METRICS_PORT, NOTIFY_CHAT_ID, OUTPUT_CACHE_DIR, OUTPUT_CACHE_MAX_BYTES, CONVERT_BLOCKS,
+                       CONTOUR_DEPTH_LAYERS, SCHEDULE_POLICY, SCHEDULE_FAIR_FOLDERS, MAX_IN_FLIGHT,
+                       FILE_MEMORY_LIMIT, FAILURE_BACKOFF, FAILURE_BACKOFF_MAX, QUARANTINE_AFTER, QUARANTINE_DIR,
+                       PROFILE_SLOW_SECONDS, PROFILE_DIR, PROFILE_MAX_CAPTURES, PROFILE_MAX_PENDING, IO_THREADS,
+                       PREFETCH_FILES, WRITE_BEHIND_FILES)
+from convert_dxf import CONVERTER_VERSION, convert_dxf_bytes, convert_dxf_with_bulge, is_already_converted
+from index_store import open_index_store
+from io_pipeline import Prefetcher, WriteBehind
+from notifier import B24Notifier
+from output_cache import OutputCache, cache_key
+from metrics import (ConversionMetrics, JsonLinesHook, PrometheusCollector, add_metrics_hook, emit_metrics, set_gauge,
+                     start_metrics_server)
+from process_dxf_utils import file_hash, get_all_dxf_files, write_atomically
+from profiler import StageProfiler, capture_profile, new_capture, write_capture
+from quarantine import Quarantine, failure_backoff
+from scheduler import ConversionQueue
+from stream_convert import convert_dxf_streaming
+from watcher import create_watcher
+from worker_pool import BackgroundJobs, run_in_processes, run_sequentially
 
+# Версия результата для индекса и кеша: режимы конвертации меняют результат так же, как версия конвертера
+CONVERTER_ID = (CONVERTER_VERSION + ("+blocks" if CONVERT_BLOCKS else "")
+                + ("+depth_layers" if CONTOUR_DEPTH_LAYERS else ""))
 
-def main_loop():
-    print("🌀 Запуск обработчика DXF...")
-    while True:
+# Процессы конвертации запускаются через forkserver (или spawn, где его нет), а не fork: к моменту запуска
+# в основном процессе работают потоки чтения наперёд, отложенной записи, метрик и уведомлений, и дочерний
+# процесс, скопированный fork-ом при захваченной ими блокировке (например, вывода), завис бы до FILE_TIMEOUT
+WORKER_START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+# Сколько следующих конвертаций профилировать по запросу (сигнал SIGUSR1)
+profile_requests = 0
+
+# Фоновое профилирование медленных файлов (BackgroundJobs), создаётся в main_loop
+profile_jobs = None
+
+
+def make_temp_path(input_path: Path) -> Path:
+    """
+    Создает пустой временный файл рядом с исходным (в той же папке, чтобы замена была атомарной).
+    Суффикс .tmp исключает его из сканирования и из событий наблюдателя.
+    """
+    with NamedTemporaryFile("w", delete=False, suffix=".dxf.tmp", dir=input_path.parent, encoding="utf-8") as tmp:
+        return Path(tmp.name)
+
+
+def run_conversion(input_path, output_path, metrics):
+    """Конвертирует input_path в output_path: большие чертежи — потоково, не загружая документ целиком."""
+    if os.path.getsize(input_path) >= STREAMING_MIN_SIZE:
+        convert_dxf_streaming(str(input_path), str(output_path), tol=CONVERT_TOL, metrics=metrics,
+                              blocks=CONVERT_BLOCKS, depth_layers=CONTOUR_DEPTH_LAYERS)
+    else:
+        convert_dxf_with_bulge(str(input_path), str(output_path), tol=CONVERT_TOL, metrics=metrics,
+                               blocks=CONVERT_BLOCKS, depth_layers=CONTOUR_DEPTH_LAYERS)
+
+
+def is_large(input_path: Path) -> bool:
+    """Файл конвертируется потоково (с диска во временный файл), а не в памяти."""
+    try:
+        return input_path.stat().st_size >= STREAMING_MIN_SIZE
+    except OSError:
+        return False  # Ошибку чтения покажет сама конвертация
+
+
+def convert_job(job) -> dict:
+    """
+    Конвертирует один файл, не заменяя оригинал. job = (input_path, data, source_state, temp_path, profile):
+    data — содержимое файла, прочитанное заранее (Prefetcher), и source_state — его (размер, mtime_ns)
+    на момент чтения, или None — тогда файл читается здесь;
+    temp_path задан для больших файлов, которые конвертируются потоково во временный файл рядом с оригиналом.
+    Возвращает outcome, длительность, метрики по этапам и результат для commit_result: содержимое output,
+    временный файл temp_path или ни то ни другое, если файл уже помечен текущей версией конвертера.
+    Если такой же по содержимому файл уже конвертировался, результат берётся из кеша OUTPUT_CACHE_DIR.
+    Если profile == True (запрос по SIGUSR1), конвертация сразу идёт под StageProfiler и в PROFILE_DIR
+    сохраняется снимок для воспроизведения. Если конвертация дольше PROFILE_SLOW_SECONDS, в результате
+    отмечается slow: снимок снимается уже после записи результата отдельным заданием (см. profile_job).
+    """
+    input_path, data, source_state, temp_path, profile = job
+    profile = profile and bool(PROFILE_DIR)
+    started = time.perf_counter()
+    metrics = StageProfiler(str(input_path)) if profile else ConversionMetrics(str(input_path))
+    if source_state is None:
+        # Состояние до чтения: изменение во время чтения тоже заметит commit_result
+        stat = input_path.stat()
+        source_state = (stat.st_size, stat.st_mtime_ns)
+    result = {"outcome": "ok", "output": None, "temp_path": temp_path, "input_hash": None, "slow": None,
+              "source_state": source_state}
+    if temp_path is None and data is None:
+        with metrics.stage("read"):
+            data = input_path.read_bytes()
+    if data is not None:
+        result["input_hash"] = hashlib.sha256(data).hexdigest()
+
+    if is_already_converted(input_path if data is None else data, CONVERT_TOL, CONVERT_BLOCKS,
+                            CONTOUR_DEPTH_LAYERS):
+        print(f"⏭️ Уже сконвертирован, пропуск: {input_path}")
+        if temp_path is not None:
+            remove_temp_file(temp_path)
+        result["outcome"], result["temp_path"] = "already_converted", None
+    else:
+        cache = OutputCache(OUTPUT_CACHE_DIR, OUTPUT_CACHE_MAX_BYTES) if OUTPUT_CACHE_DIR else None
+        cached = False
+        if cache is not None:
+            with metrics.stage("cache_lookup"):
+                key = cache_key(result["input_hash"] or file_hash(input_path), CONVERTER_ID, CONVERT_TOL)
+                if temp_path is not None:
+                    cached = cache.get(key, temp_path)
+                else:
+                    result["output"] = cache.read(key)
+                    cached = result["output"] is not None
+        if cached:
+            print(f"♻️ Результат взят из кеша: {input_path}")
+            result["outcome"] = "cache_hit"
+        elif temp_path is not None:
+            metrics.run(run_conversion, input_path, temp_path, metrics)
+            # bytes_written появляется только после успешной записи результата; при ошибке чтения
+            # конвертер лишь печатает её, и пустой временный файл не должен заменить оригинал
+            if "bytes_written" not in metrics.counters:
+                raise RuntimeError("не удалось прочитать DXF файл (повреждён или недоступен)")
+            if cache is not None:
+                with metrics.stage("cache_store"):
+                    cache.put(key, temp_path)
+        else:
+            result["output"] = metrics.run(convert_dxf_bytes, data, tol=CONVERT_TOL, metrics=metrics,
+                                           blocks=CONVERT_BLOCKS, depth_layers=CONTOUR_DEPTH_LAYERS)
+            if cache is not None:
+                with metrics.stage("cache_store"):
+                    cache.write(key, result["output"])
+
+        elapsed = time.perf_counter() - started
+        if profile:
+            save_profile(input_path, data, metrics, elapsed)
+        elif PROFILE_DIR and PROFILE_SLOW_SECONDS is not None and elapsed >= PROFILE_SLOW_SECONDS:
+            result["slow"] = elapsed
+
+    result["duration"] = time.perf_counter() - started
+    result["metrics"] = metrics.as_record()
+    return result
+
+
+def commit_result(input_path: Path, result) -> dict:
+    """
+    Записывает результат convert_job на место оригинала (в потоке отложенной записи) и возвращает
+    состояние нового файла для индекса: размер, mtime, хеш содержимого и время записи.
+    Если оригинал изменился после чтения (размер или mtime не совпадают с source_state), результат
+    устарел: ничего не записывается и возвращается None, файл нужно обработать заново.
+    Для медленной конвертации перед заменой оригинал копируется в новый снимок (capture) для profile_job.
+    """
+    started = time.perf_counter()
+    stat = input_path.stat()
+    if (stat.st_size, stat.st_mtime_ns) != result["source_state"]:
+        return None
+    capture = None
+    if result["slow"] is not None:
+        try:
+            capture = new_capture(input_path, PROFILE_DIR)
+        except OSError as e:
+            print(f"‼️ Не удалось сохранить копию {input_path} для профилирования: {e}")
+    if result["output"] is not None:
+        write_atomically(input_path, result["output"])
+        content_hash = hashlib.sha256(result["output"]).hexdigest()
+    elif result["temp_path"] is not None:
+        os.replace(result["temp_path"], input_path)
+        content_hash = file_hash(input_path)
+    else:
+        content_hash = result["input_hash"] or file_hash(input_path)  # Файл уже был сконвертирован
+    stat = input_path.stat()
+    return {"size": stat.st_size, "mtime": stat.st_mtime, "content_hash": content_hash,
+            "commit": time.perf_counter() - started, "capture": capture}
+
+
+def save_profile(input_path, data, profiler, elapsed):
+    """Снимок профиля конвертации, выполненной под StageProfiler; ошибка при его создании не мешает конвертации."""
+    print(f"🔬 Профилирование {input_path} (request, конвертация {elapsed:.1f} с)")
+    try:
+        capture = write_capture(new_capture(input_path, PROFILE_DIR, data), profiler, PROFILE_MAX_CAPTURES,
+                                "request", elapsed, {"duration": elapsed})
+    except Exception as e:
+        print(f"‼️ Не удалось сохранить профиль {input_path}: {e}")
+        return
+    print(f"🔬 Профиль сохранён: {capture}")
+
+
+def profile_job(job) -> Path:
+    """
+    Профилирует медленную конвертацию повтором на копии из снимка. job = (capture, input_path, details).
+    Выполняется в фоне после записи результата отдельным процессом со своим лимитом FILE_TIMEOUT и пониженным
+    приоритетом, поэтому повтор не удлиняет и не срывает конвертацию и не задерживает очередь.
+    """
+    if hasattr(os, "nice"):
+        os.nice(10)
+    capture, input_path, details = job
+    return capture_profile(capture, input_path, run_conversion, PROFILE_MAX_CAPTURES, "slow", details)
+
+
+def report_profile_job(job, ok, result):
+    capture, input_path, details = job
+    if ok:
+        print(f"🔬 Профиль {input_path} (slow, конвертация {details['duration']:.1f} с) сохранён: {result}")
+    else:
+        print(f"‼️ Не удалось снять профиль {input_path}: {result}; копия файла сохранена в {capture}")
+
+
+def queue_profile_job(job):
+    """Ставит профилирование медленного файла в фоновую очередь; если она заполнена, остаётся только копия файла."""
+    capture, input_path, _ = job
+    if profile_jobs is None or not profile_jobs.submit(job):
+        print(f"⚠️ Профилирование {input_path} пропущено (очередь профилирования заполнена), "
+              f"копия файла сохранена в {capture}")
+
+
+def remove_temp_file(temp_path: Path):
+    """Удаляет временный файл, оставшийся после неудачной или прерванной конвертации."""
+    try:
+        temp_path.unlink(missing_ok=True)
+    except OSError as e:
+        print(f"⚠️ Не удалось удалить временный файл {temp_path}: {e}")
+
+
+def is_up_to_date(record, input_path: Path, store, rel_path) -> bool:
+    """
+    Проверяет, что файл уже сконвертирован текущей версией с текущим допуском и с тех пор не менялся.
+    Если совпадают размер и mtime — файл не читается; если изменился только mtime, сравнивается хеш содержимого.
+    """
+    if record is None or record["converter_version"] != CONVERTER_ID or record["tol"] != CONVERT_TOL:
+        return False
+
+    stat = input_path.stat()
+    if record["mtime"] == stat.st_mtime and record["size"] in (None, stat.st_size):
+        return True
+
+    if record["content_hash"] is not None and record["size"] == stat.st_size \
+            and file_hash(input_path) == record["content_hash"]:
+        # Файл «потрогали», но содержимое то же — только обновляем mtime
+        store.upsert(rel_path, mtime=stat.st_mtime)
+        return True
+    return False
+
+
+def is_backing_off(record, input_path: Path) -> bool:
+    """Файл недавно не удалось сконвертировать, время повтора не наступило и с тех пор он не менялся."""
+    if record is None or not record["retry_at"] or time.time() >= record["retry_at"]:
+        return False
+    return input_path.stat().st_mtime == record["failed_mtime"]
+
+
+def find_changed_files(candidates, store):
+    """
+    Отбирает из candidates существующие файлы, которые нужно (пере)конвертировать.
+    Файлы, на которых недавно была ошибка, пропускаются до времени повтора, если их не заменили.
+    """
+    changed_files = {}  # Path -> относительный путь
+    for input_path in candidates:
+        rel_path = input_path.relative_to(INPUT_DIR).as_posix()
+        if not input_path.is_file():  # Удалён или перенесён (в т.ч. в карантин) после события наблюдателя
+            continue
+        try:
+            record = store.get(rel_path)
+            if is_up_to_date(record, input_path, store, rel_path) or is_backing_off(record, input_path):
+                continue
+        except FileNotFoundError:
+            continue
+        except OSError as e:
+            # Нет прав, сбой сетевого диска и т.п.: ошибка этого файла не должна прерывать весь проход
+            record_failure(store, rel_path, f"не удалось прочитать файл: {e}", counted=False)
+            continue
+        changed_files[input_path] = rel_path
+    return changed_files
+
+
+def record_success(store, rel_path, result, timing=None):
+    """timing — время ожидания в очереди и полная задержка от обнаружения файла (ConversionQueue.done)."""
+    metrics = result.pop("metrics", {})
+    store.upsert(rel_path, converter_version=CONVERTER_ID, tol=CONVERT_TOL, error=None, failures=0, retry_at=None,
+                 failed_mtime=None, **result)
+    record = {**metrics, "path": rel_path, "outcome": result["outcome"], "duration": result["duration"]}
+    if timing:
+        record["stages"] = {**record.get("stages", {}), "queue_wait": timing["queue_wait"]}
+        record["latency"] = timing["latency"]
+    emit_metrics(record)
+    print(f"✅ Успешно: {rel_path}")
+
+
+def record_failure(store, rel_path, error, duration=None, timing=None, counted=True):
+    """
+    Запоминает ошибку и откладывает повтор с экспоненциально растущей паузой (FAILURE_BACKOFF).
+    После QUARANTINE_AFTER ошибок подряд на одном и том же файле он переносится в карантин.
+    counted=False — ошибка не в самом чертеже (ввод-вывод, тайм-аут, падение процесса): повтор
+    откладывается, но ошибка не засчитывается в счёт для карантина.
+    """
+    # Состояние сконвертированного файла (размер, mtime, хеш) не трогаем, чтобы файл был обработан повторно
+    input_path = Path(INPUT_DIR) / rel_path
+    try:
+        failed_mtime = input_path.stat().st_mtime
+    except OSError:
+        failed_mtime = None
+    previous = store.get(rel_path)
+    # Счёт ошибок начинается заново, если файл заменили после прошлой ошибки
+    failures = 0
+    if previous is not None and previous["failures"] and previous["failed_mtime"] == failed_mtime:
+        failures = previous["failures"]
+    if counted:
+        failures += 1
+
+    record = {"path": rel_path, "outcome": "error", "error": error, "duration": duration, "failures": failures}
+    if timing:
+        record["latency"] = timing["latency"]
+
+    if QUARANTINE_DIR and counted and failures >= QUARANTINE_AFTER and failed_mtime is not None:
+        quarantine = Quarantine(QUARANTINE_DIR)
         try:
-            index = read_index(INDEX_JSON)
-            updated_index = index.copy()
+            target = quarantine.add(input_path, rel_path, error, failures)
+        except OSError as e:
+            print(f"‼️ Не удалось перенести {rel_path} в карантин: {e}")
+        else:
+            store.delete(rel_path)
+            set_gauge("quarantined_files", len(quarantine.entries()))
+            emit_metrics({**record, "outcome": "quarantined"})
+            print(f"🚫 {rel_path}: ошибок подряд {failures}, файл перенесён в карантин {target}: {error}")
+            return
+
+    delay = failure_backoff(max(failures, 1), FAILURE_BACKOFF, FAILURE_BACKOFF_MAX)
+    store.upsert(rel_path, outcome="error", error=error, duration=duration, failures=failures,
+                 retry_at=time.time() + delay, failed_mtime=failed_mtime)
+    emit_metrics(record)
+    counter = f"ошибок подряд: {failures}" if counted else "не в счёт карантина"
+    print(f"❌ Ошибка при обработке {rel_path} ({counter}, повтор через {delay:.0f} с): {error}")
+
+
+def split_duplicates(input_paths):
+    """
+    Делит файлы на два прохода: в первом — по одному файлу каждого содержимого, во втором — их копии.
+    Так параллельные процессы не конвертируют одинаковые файлы одновременно, и копии берутся из кеша.
+    Хеш считается только для файлов с совпадающим размером. Файлы, которые не удалось прочитать,
+    идут в первый проход: ошибку покажет и запишет сама конвертация.
+    """
+    by_size = {}
+    first, duplicates = [], []
+    for input_path in input_paths:
+        try:
+            by_size.setdefault(input_path.stat().st_size, []).append(input_path)
+        except OSError:
+            first.append(input_path)
+    for same_size in by_size.values():
+        if len(same_size) == 1:
+            first += same_size
+            continue
+        seen = set()
+        for input_path in same_size:
+            try:
+                content_hash = file_hash(input_path)
+            except OSError:
+                first.append(input_path)
+                continue
+            (duplicates if content_hash in seen else first).append(input_path)
+            seen.add(content_hash)
+    return first, duplicates
+
+
+def take_profile_request() -> bool:
+    """Забирает один запрос профилирования: True — следующую конвертацию нужно профилировать."""
+    global profile_requests
+    if profile_requests <= 0:
+        return False
+    profile_requests -= 1
+    return True
+
+
+def convert_changed_files(changed_files, store, refill=None):
+    """
+    Конвертирует файлы в порядке очереди ConversionQueue и записывает результат каждого в индекс.
+    refill() возвращает файлы, изменившиеся за время обработки ({Path: относительный путь}); они встают
+    в ту же очередь и по приоритету могут обогнать найденные раньше.
 
-            for input_path in get_all_dxf_files(INPUT_DIR):
-                rel_path = input_path.relative_to(INPUT_DIR).as_posix()
-                current_mtime = input_path.stat().st_mtime
+    Ввод-вывод перекрывается с конвертацией: ближайшие файлы очереди заранее читаются в память (Prefetcher),
+    а результаты записываются на место оригиналов в фоновых потоках (WriteBehind). Индекс обновляется
+    после записи результата.
+    """
+    queue = ConversionQueue(SCHEDULE_POLICY, SCHEDULE_FAIR_FOLDERS, MAX_IN_FLIGHT)
+    rel_paths = dict(changed_files)
+    committing = set()  # Файлы, результат которых ещё записывается: события о них не ставят их в очередь снова
+    prefetcher = Prefetcher(IO_THREADS, PREFETCH_FILES, STREAMING_MIN_SIZE - 1)
+    writer = WriteBehind(IO_THREADS, WRITE_BEHIND_FILES)
 
-                if rel_path not in index or index[rel_path] != current_mtime:
-                    print(f"📂 Обработка: {rel_path}")
-                    try:
-                        # Создаем временный файл рядом
-                        with NamedTemporaryFile("w", delete=False, suffix=".dxf", dir=input_path.parent, encoding="utf-8") as tmp:
-                            temp_path = Path(tmp.name)
+    def take_next():
+        if refill is not None:
+            for input_path, rel_path in refill().items():
+                if input_path not in committing:
+                    rel_paths[input_path] = rel_path
+                    queue.push(input_path, rel_path)
+        return queue.pop()
 
-                        # Конвертируем во временный файл
-                        convert_dxf_with_bulge(str(input_path), str(temp_path))
+    def jobs():
+        # Задание собирается при запуске: прочитанное заранее содержимое или временный файл для потокового режима
+        while True:
+            entry = take_next()
+            if entry is None:
+                return
+            input_path, rel_path = entry
+            print(f"📂 Обработка: {rel_path}")
+            data, source_state = prefetcher.take(input_path) or (None, None)
+            prefetcher.prefetch(queue.peek(PREFETCH_FILES))
+            temp_path = make_temp_path(input_path) if data is None and is_large(input_path) else None
+            yield input_path, data, source_state, temp_path, take_profile_request()
 
-                        # Заменяем оригинал
-                        shutil.move(str(temp_path), str(input_path))
+    def record_committed(finished):
+        for (input_path, result, timing), ok, state in finished:
+            committing.discard(input_path)
+            rel_path = rel_paths[input_path]
+            if not ok:
+                if result["temp_path"] is not None:
+                    remove_temp_file(result["temp_path"])
+                record_failure(store, rel_path, f"не удалось записать результат: {state}", result["duration"], timing,
+                               counted=False)
+                continue
+            if state is None:
+                # Оригинал сохранили во время конвертации: результат по старому содержимому отбрасывается
+                print(f"🔁 {rel_path} изменён во время конвертации, будет обработан заново")
+                if result["temp_path"] is not None:
+                    remove_temp_file(result["temp_path"])
+                queue.push(input_path, rel_path)
+                continue
+            metrics = result["metrics"]
+            metrics["stages"]["commit"] = state.pop("commit")
+            capture = state.pop("capture")
+            if capture is not None:
+                queue_profile_job((capture, input_path, {"duration": result["slow"], "original": metrics}))
+            record_success(store, rel_path, {**state, "duration": result["duration"] + metrics["stages"]["commit"],
+                                             "outcome": result["outcome"], "metrics": metrics}, timing)
 
-                        # Обновляем mtime после замены
-                        updated_index[rel_path] = input_path.stat().st_mtime
+    # В отдельных процессах действуют лимиты FILE_TIMEOUT и FILE_MEMORY_LIMIT, поэтому так обрабатывается
+    # и одиночный файл; при MAX_WORKERS == 1 конвертация идёт в основном процессе без лимитов
+    workers = min(MAX_WORKERS, MAX_IN_FLIGHT)
+    if MAX_WORKERS > 1:
+        if len(changed_files) > 1:
+            print(f"⚙️ Параллельная обработка {len(changed_files)} файлов ({workers} процессов, "
+                  f"порядок: {SCHEDULE_POLICY})")
+        rounds = split_duplicates(changed_files) if OUTPUT_CACHE_DIR else (list(changed_files),)
+    else:
+        rounds = (list(changed_files),)
 
-                        print(f"✅ Успешно: {rel_path}")
-                        time.sleep(DELAY_BETWEEN_FILES)
+    def run_round():
+        if MAX_WORKERS > 1:
+            results = run_in_processes(convert_job, jobs(), workers, FILE_TIMEOUT, WORKER_START_METHOD,
+                                       FILE_MEMORY_LIMIT)
+        else:
+            results = run_sequentially(convert_job, jobs())
+        for (input_path, _, _, temp_path, _), ok, result in results:
+            timing = queue.done(input_path)
+            if ok:
+                committing.add(input_path)
+                writer.submit((input_path, result, timing), commit_result, input_path, result)
+            else:
+                if temp_path is not None:
+                    remove_temp_file(temp_path)
+                # В счёт для карантина идут только ошибки самой конвертации (исключение или нехватка памяти)
+                record_failure(store, rel_paths[input_path], result, timing=timing,
+                               counted=result.kind in ("error", "memory"))
+            record_committed(writer.collect())
+            if MAX_WORKERS == 1:
+                time.sleep(DELAY_BETWEEN_FILES)
+        record_committed(writer.collect(wait_all=True))
 
-                    except Exception as e:
-                        print(f"❌ Ошибка при обработке {rel_path}: {e}")
+    try:
+        for input_paths in rounds:
+            for input_path in input_paths:
+                queue.push(input_path, changed_files[input_path])
+            run_round()
+        # Файлы, изменённые во время конвертации (commit_result их не записал), обрабатываются заново
+        while len(queue):
+            run_round()
+    finally:
+        prefetcher.close()
+        writer.close()
 
-            # Удаление исчезнувших файлов
-            existing_files = {f.relative_to(INPUT_DIR).as_posix() for f in get_all_dxf_files(INPUT_DIR)}
-            for key in list(updated_index.keys()):
-                if key not in existing_files:
-                    print(f"🧹 Удалён из index.json (файла уже нет): {key}")
-                    del updated_index[key]
-                    time.sleep(DELAY_BETWEEN_FILES)
 
-            write_index_safely(updated_index, INDEX_JSON)
-            time.sleep(CHECK_INTERVAL)
+def remove_missing_files(store, rel_paths):
+    """Удаляет из индекса записи rel_paths, файлов которых уже нет."""
+    for key in rel_paths:
+        print(f"🧹 Удалён из индекса (файла уже нет): {key}")
+        store.delete(key)
+        time.sleep(DELAY_BETWEEN_FILES)
+
+
+def full_sweep(store, refill=None):
+    """Полное сканирование INPUT_DIR: конвертация изменённых файлов и очистка индекса от исчезнувших."""
+    all_files = get_all_dxf_files(INPUT_DIR)
+    convert_changed_files(find_changed_files(all_files, store), store, refill)
+
+    # Удаление исчезнувших файлов (по результатам того же сканирования). Файлы, появившиеся уже после него
+    # (их добавил в очередь refill), проверяются на диске
+    existing_files = {f.relative_to(INPUT_DIR).as_posix() for f in all_files}
+    remove_missing_files(store, [key for key in store.paths()
+                                 if key not in existing_files and not (Path(INPUT_DIR) / key).exists()])
+
+
+def take_watched_paths(store, paths):
+    """Пути от наблюдателя: удалённые убираются из индекса, возвращаются новые/изменённые файлы для конвертации."""
+    missing = [path.relative_to(INPUT_DIR).as_posix() for path in paths if not path.exists()]
+    remove_missing_files(store, [key for key in missing if store.get(key) is not None])
+    return find_changed_files(paths, store)
+
+
+def watched_sweep(store, paths, refill=None):
+    """Обработка путей, о которых сообщил наблюдатель: новые/изменённые конвертируются, удалённые убираются из индекса."""
+    convert_changed_files(take_watched_paths(store, paths), store, refill)
+
+
+def setup_metrics():
+    """Подключает журнал метрик и локальную страницу метрик для Prometheus согласно настройкам."""
+    if METRICS_LOG:
+        add_metrics_hook(JsonLinesHook(METRICS_LOG))
+    if METRICS_PORT:
+        collector = PrometheusCollector()
+        add_metrics_hook(collector)
+        try:
+            start_metrics_server(collector, METRICS_PORT)
+            print(f"📊 Метрики: http://127.0.0.1:{METRICS_PORT}/metrics")
+        except OSError as e:
+            print(f"‼️ Не удалось запустить сервер метрик на порту {METRICS_PORT}: {e}")
+
+
+def setup_notifications():
+    """
+    Уведомления об ошибках конвертации в чат NOTIFY_CHAT_ID. Отправляются фоновым потоком пачками,
+    поэтому медленный или недоступный Bitrix24 не задерживает обработку файлов.
+    """
+    if not NOTIFY_CHAT_ID:
+        return None
+    notifier = B24Notifier()
+
+    def notify_failure(record):
+        if record.get("outcome") == "error":
+            notifier.notify(NOTIFY_CHAT_ID, f"❌ Ошибка конвертации DXF {record['path']}: {record.get('error')}")
+        elif record.get("outcome") == "quarantined":
+            notifier.notify(NOTIFY_CHAT_ID, f"🚫 DXF {record['path']} перенесён в карантин после "
+                                            f"{record['failures']} ошибок: {record.get('error')}")
+
+    add_metrics_hook(notify_failure)
+    print(f"🔔 Уведомления об ошибках в чат {NOTIFY_CHAT_ID}")
+    return notifier
+
+
+def setup_profile_signal():
+    """По сигналу SIGUSR1 (kill -USR1 <pid>, только Unix) профилируется следующий обрабатываемый файл."""
+    if not PROFILE_DIR or not hasattr(signal, "SIGUSR1"):
+        return
+
+    def request_profile(signum, frame):
+        # Без print: обработчик сигнала может прервать вывод в основном потоке
+        global profile_requests
+        profile_requests += 1
+
+    signal.signal(signal.SIGUSR1, request_profile)
+    slow = f", автоматически — дольше {PROFILE_SLOW_SECONDS} с" if PROFILE_SLOW_SECONDS is not None else ""
+    print(f"🔬 Профилирование по запросу: kill -USR1 {os.getpid()}{slow}; снимки в {PROFILE_DIR}")
+
+
+def setup_profile_jobs():
+    """Фоновое профилирование медленных файлов (PROFILE_SLOW_SECONDS) отдельными процессами."""
+    global profile_jobs
+    if PROFILE_DIR and PROFILE_SLOW_SECONDS is not None:
+        profile_jobs = BackgroundJobs(profile_job, FILE_TIMEOUT, PROFILE_MAX_PENDING, report_profile_job,
+                                      WORKER_START_METHOD, FILE_MEMORY_LIMIT)
+
+
+def main_loop():
+    print("🌀 Запуск обработчика DXF...")
+    if WORKER_START_METHOD == "forkserver":
+        # Сервер процессов заранее импортирует конвертер (ezdxf, numpy), процессы конвертации не тратят на это время
+        multiprocessing.set_forkserver_preload(["main"])
+    setup_metrics()
+    notifier = setup_notifications()
+    setup_profile_signal()
+    setup_profile_jobs()
+    store = open_index_store(INDEX_DB, INDEX_JSON, INPUT_DIR, CONVERT_TOL)
+    if QUARANTINE_DIR:
+        quarantine = Quarantine(QUARANTINE_DIR)
+        print(f"🚫 {quarantine.summary()}")
+        set_gauge("quarantined_files", len(quarantine.entries()))
+    watcher = create_watcher(INPUT_DIR, WATCH_DEBOUNCE, WATCH_MODE)
+    if watcher is not None:
+        print(f"👀 Отслеживание изменений через inotify, полная сверка каждые {RECONCILE_INTERVAL} с")
+    last_full_sweep = None
+    # Файлы, появившиеся во время обработки очереди, встают в неё сразу, не дожидаясь конца прохода
+    refill = (lambda: take_watched_paths(store, watcher.wait(0))) if watcher is not None else None
+
+    while True:
+        try:
+            if watcher is None:
+                full_sweep(store)
+                time.sleep(CHECK_INTERVAL)
+                continue
+
+            # Периодическая полная сверка остаётся страховкой от пропущенных событий
+            if (last_full_sweep is None or watcher.needs_full_scan
+                    or time.monotonic() - last_full_sweep >= RECONCILE_INTERVAL):
+                watcher.needs_full_scan = False
+                full_sweep(store, refill)
+                last_full_sweep = time.monotonic()
+
+            ready_paths = watcher.wait(max(0.0, last_full_sweep + RECONCILE_INTERVAL - time.monotonic()))
+            if ready_paths:
+                watched_sweep(store, ready_paths, refill)
 
         except KeyboardInterrupt:
             print("🛑 Остановка пользователем (Ctrl+C)")
@@ -59,6 +619,14 @@ def main_loop():
             print(f"‼️ Ошибка основного цикла: {loop_ex}")
             time.sleep(10)
 
+    if watcher is not None:
+        watcher.close()
+    if profile_jobs is not None:
+        profile_jobs.close(timeout=1.0)
+    if notifier is not None:
+        notifier.close()
+    store.close()
+
 
 if __name__ == "__main__":
     main_loop()
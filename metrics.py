@@ -0,0 +1,151 @@
+import json
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_hooks = []
+_lock = threading.Lock()
+
+
+class ConversionMetrics:
+    """
+    Время по этапам и счётчики одной конвертации.
+    Передаётся в конвертер, затем в виде словаря (as_record) — в обработчики метрик.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.stages = {}  # этап -> секунды
+        self.counters = {}  # имя -> значение
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - started
+
+    def count(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def run(self, func, *args, **kwargs):
+        """Вызывает func; StageProfiler вдобавок профилирует код func вне этапов."""
+        return func(*args, **kwargs)
+
+    def as_record(self):
+        return {"path": self.path, "stages": dict(self.stages), "counters": dict(self.counters)}
+
+
+def add_metrics_hook(hook):
+    """Регистрирует обработчик метрик: hook(record) вызывается для каждого обработанного файла."""
+    _hooks.append(hook)
+
+
+def emit_metrics(record):
+    """Передаёт запись всем обработчикам; ошибка обработчика не прерывает конвертацию."""
+    record.setdefault("time", time.time())
+    for hook in list(_hooks):
+        try:
+            hook(record)
+        except Exception as e:
+            print(f"‼️ Ошибка обработчика метрик {hook}: {e}")
+
+
+def set_gauge(name, value):
+    """
+    Текущее значение (например, длина очереди), публикуется обработчикам, у которых есть set_gauge.
+    value может быть словарём {(метка, значение): число} — значения по меткам (например, длина очереди по папкам).
+    """
+    for hook in list(_hooks):
+        if hasattr(hook, "set_gauge"):
+            hook.set_gauge(name, value)
+
+
+class JsonLinesHook:
+    """Дописывает каждую запись отдельной строкой JSON в файл."""
+
+    def __init__(self, path):
+        self.path = path
+
+    def __call__(self, record):
+        with _lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def escape_label_value(value):
+    """Значение метки для текстового формата Prometheus: экранируются обратная косая черта, кавычка и перевод строки."""
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class PrometheusCollector:
+    """Накопительные метрики в текстовом формате Prometheus (сумма и число измерений по этапам, счётчики, gauge)."""
+
+    def __init__(self, prefix="dxf"):
+        self.prefix = prefix
+        self._files = {}  # outcome -> число файлов
+        self._stage_sum = {}
+        self._stage_count = {}
+        self._counters = {}
+        self._gauges = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, record):
+        with self._lock:
+            outcome = record.get("outcome", "ok")
+            self._files[outcome] = self._files.get(outcome, 0) + 1
+            for stage, seconds in record.get("stages", {}).items():
+                self._stage_sum[stage] = self._stage_sum.get(stage, 0.0) + seconds
+                self._stage_count[stage] = self._stage_count.get(stage, 0) + 1
+            for name, value in record.get("counters", {}).items():
+                self._counters[name] = self._counters.get(name, 0) + value
+
+    def set_gauge(self, name, value):
+        with self._lock:
+            self._gauges[name] = value
+
+    def render(self):
+        p = self.prefix
+        lines = [f"# TYPE {p}_files_total counter"]
+        with self._lock:
+            lines += [f'{p}_files_total{{outcome="{escape_label_value(k)}"}} {v}'
+                      for k, v in sorted(self._files.items())]
+            lines.append(f"# TYPE {p}_stage_seconds summary")
+            for stage in sorted(self._stage_sum):
+                label = escape_label_value(stage)
+                lines.append(f'{p}_stage_seconds_sum{{stage="{label}"}} {self._stage_sum[stage]:.6f}')
+                lines.append(f'{p}_stage_seconds_count{{stage="{label}"}} {self._stage_count[stage]}')
+            for name, value in sorted(self._counters.items()):
+                lines += [f"# TYPE {p}_{name}_total counter", f"{p}_{name}_total {value}"]
+            for name, value in sorted(self._gauges.items()):
+                lines.append(f"# TYPE {p}_{name} gauge")
+                if isinstance(value, dict):
+                    lines += [f'{p}_{name}{{{label}="{escape_label_value(key)}"}} {v}'
+                              for (label, key), v in sorted(value.items())]
+                else:
+                    lines.append(f"{p}_{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def start_metrics_server(collector, port, host="127.0.0.1"):
+    """Запускает в фоновом потоке HTTP-сервер, отдающий collector.render() по /metrics."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.rstrip("/") not in ("", "/metrics"):
+                self.send_error(404)
+                return
+            body = collector.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # Не засоряем вывод обработчика запросами сборщика метрик
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,180 @@
+import queue
+import threading
+import time
+from io import BytesIO
+
+import requests
+
+from constants import BASE_WEBHOOK
+from send_message_b24 import (BATCH_LIMIT, B24Error, call_batch, get_public_link, make_session, message_command,
+                              upload_file_to_folder)
+
+_STOP = object()
+
+
+class B24Notifier:
+    """
+    Фоновая отправка уведомлений в Bitrix24, не блокирующая конвертацию.
+
+    notify() только кладёт событие в очередь (при переполнении событие отбрасывается), отдельный поток
+    собирает события за batch_window секунд и отправляет их одним вызовом batch (до BATCH_LIMIT команд).
+    Неудачный вызов повторяется с экспоненциальной задержкой, после max_retries попыток пачка отбрасывается.
+    base_webhook можно направить на локальную заглушку для проверки.
+    """
+
+    def __init__(self, base_webhook=BASE_WEBHOOK, max_queue=1000, batch_window=1.0, max_retries=5, backoff=1.0,
+                 max_backoff=60.0, session=None):
+        self.base_webhook = base_webhook
+        self.batch_window = batch_window
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.session = session or make_session(retries=0)  # Повторы с задержкой делает сам поток отправки
+        self.sent = 0
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._closing = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="b24-notifier", daemon=True)
+        self._thread.start()
+
+    def notify(self, chat_id, message, user_id=None) -> bool:
+        """Ставит сообщение в очередь. Возвращает False, если очередь переполнена или отправка остановлена."""
+        return self._put(("message", message_command(chat_id, message, user_id)))
+
+    def notify_file(self, folder_id, data: bytes, filename, chat_id, message, user_id=None) -> bool:
+        """
+        Загружает файл в папку диска и отправляет в чат сообщение со ссылкой на него: f"{message} {ссылка}".
+        Загрузка и получение ссылки выполняются в фоновом потоке, сообщение уходит в общей пачке batch.
+        """
+        return self._put(("file", folder_id, data, filename, chat_id, message, user_id))
+
+    def flush(self, timeout=None) -> bool:
+        """Ждёт отправки всех поставленных в очередь событий. Возвращает False по истечении timeout."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+    def close(self, timeout=10.0):
+        """Отправляет оставшиеся события (повторы без задержек) и останавливает поток."""
+        if self._closing.is_set():
+            return
+        self._closing.set()
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            pass
+        self._thread.join(timeout)
+        self.session.close()
+
+    def _put(self, event) -> bool:
+        if self._closing.is_set():
+            return False
+        try:
+            self._queue.put_nowait(event)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            print("‼️ Очередь уведомлений Bitrix24 переполнена, уведомление отброшено")
+            return False
+
+    def _run(self):
+        stop = False
+        while not stop:
+            event = self._queue.get()
+            if event is _STOP:
+                self._queue.task_done()
+                break
+            events = [event]
+            # Копим события в течение окна, чтобы отправить их одним вызовом batch
+            deadline = time.monotonic() + self.batch_window
+            while len(events) < BATCH_LIMIT:
+                # При остановке окно не ждём, но уже накопившиеся события всё равно собираем в пачку
+                timeout = 0.0 if self._closing.is_set() else max(0.0, deadline - time.monotonic())
+                try:
+                    event = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if event is _STOP:
+                    self._queue.task_done()
+                    stop = True
+                    break
+                events.append(event)
+            try:
+                self._deliver_safely(events)
+            finally:
+                for _ in events:
+                    self._queue.task_done()
+        # Остаток очереди после остановки отправляем без окна накопления
+        rest = []
+        while True:
+            try:
+                event = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if event is not _STOP:
+                rest.append(event)
+            self._queue.task_done()
+        for start in range(0, len(rest), BATCH_LIMIT):
+            self._deliver_safely(rest[start:start + BATCH_LIMIT])
+
+    def _deliver_safely(self, events):
+        try:
+            self._deliver(events)
+        except Exception as e:  # Поток уведомлений не должен умирать из-за непредвиденной ошибки
+            self.dropped += len(events)
+            print(f"‼️ Ошибка отправки уведомлений Bitrix24: {e}")
+
+    def _deliver(self, events):
+        commands = {}
+        for event in events:
+            if event[0] == "message":
+                commands[f"m{len(commands)}"] = event[1]
+                continue
+            _, folder_id, data, filename, chat_id, message, user_id = event
+            try:
+                link = self._with_retry(lambda: self._upload(folder_id, data, filename), f"загрузка {filename}")
+            except Exception as e:  # Неудачная загрузка одного файла не отменяет остальные сообщения пачки
+                print(f"‼️ Bitrix24: загрузка {filename} не удалась: {e}")
+                link = None
+            if link is None:
+                self.dropped += 1
+            else:
+                commands[f"m{len(commands)}"] = message_command(chat_id, f"{message} {link}", user_id)
+        if not commands:
+            return
+
+        result = self._with_retry(lambda: call_batch(commands, base_webhook=self.base_webhook,
+                                                     session=self.session), f"пачка из {len(commands)} сообщений")
+        if result is None:
+            self.dropped += len(commands)
+            return
+        errors = result.get("result_error") or {}
+        # Ошибки отдельных команд (неверный чат и т. п.) повтором не исправить — только сообщаем
+        for key, error in errors.items():
+            print(f"‼️ Bitrix24 отклонил уведомление {key}: {error}")
+        self.sent += len(commands) - len(errors)
+        self.dropped += len(errors)
+
+    def _upload(self, folder_id, data, filename):
+        result = upload_file_to_folder(folder_id, BytesIO(data), filename, self.base_webhook, self.session)
+        file_id = result.get("result", {}).get("ID")
+        if not file_id:
+            raise B24Error(f"Bitrix24 не вернул ID загруженного файла: {result}")
+        return get_public_link(file_id, self.base_webhook, self.session)
+
+    def _with_retry(self, func, description):
+        """Вызывает func с повторами и экспоненциальной задержкой; None — если все попытки неудачны."""
+        for attempt in range(self.max_retries + 1):
+            try:
+                return func()
+            except (requests.RequestException, B24Error) as e:
+                if attempt == self.max_retries:
+                    print(f"‼️ Bitrix24: {description} не отправлено после {attempt + 1} попыток: {e}")
+                    return None
+                delay = min(self.backoff * 2 ** attempt, self.max_backoff)
+                print(f"⚠️ Bitrix24: {description} — ошибка ({e}), повтор через {delay:.1f} с")
+                # При остановке повторяем без задержки, чтобы close() не ждал минутами
+                self._closing.wait(delay)
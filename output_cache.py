@@ -0,0 +1,87 @@
+import hashlib
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+
+def cache_key(input_hash: str, converter_version: str, tol: float) -> str:
+    """Ключ кеша: хеш входного файла вместе с версией конвертера и допуском."""
+    return hashlib.sha256(f"{input_hash}|{converter_version}|{tol!r}".encode("utf-8")).hexdigest()
+
+
+class OutputCache:
+    """
+    Кеш результатов конвертации на диске с адресацией по содержимому.
+
+    Одинаковые по содержимому чертежи (повторные выгрузки одних и тех же деталей) конвертируются один раз,
+    дальше результат копируется из кеша. Размер кеша ограничен max_bytes: при превышении удаляются
+    записи, которые дольше всего не использовались (время использования — mtime файла записи).
+    Записи пишутся через временный файл и os.replace, поэтому кешем могут пользоваться несколько процессов.
+    """
+
+    def __init__(self, cache_dir, max_bytes):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+
+    def _entry_path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.dxf"
+
+    def get(self, key: str, target_path) -> bool:
+        """Копирует результат из кеша в target_path. Возвращает False, если записи нет."""
+        entry = self._entry_path(key)
+        try:
+            shutil.copyfile(entry, target_path)
+            os.utime(entry)  # Отмечаем использование для вытеснения по LRU
+        except FileNotFoundError:
+            return False
+        return True
+
+    def read(self, key: str):
+        """Содержимое записи (bytes) или None, если записи нет."""
+        entry = self._entry_path(key)
+        try:
+            data = entry.read_bytes()
+            os.utime(entry)
+        except FileNotFoundError:
+            return None
+        return data
+
+    def write(self, key: str, data: bytes):
+        """Сохраняет содержимое data под ключом key и при необходимости вытесняет старые записи."""
+        entry = self._entry_path(key)
+        entry.parent.mkdir(exist_ok=True)
+        with tempfile.NamedTemporaryFile(delete=False, dir=entry.parent, suffix=".tmp") as tmp:
+            tmp.write(data)
+        os.replace(tmp.name, entry)
+        self.evict()
+
+    def put(self, key: str, source_path):
+        """Сохраняет копию source_path под ключом key и при необходимости вытесняет старые записи."""
+        entry = self._entry_path(key)
+        entry.parent.mkdir(exist_ok=True)
+        with tempfile.NamedTemporaryFile(delete=False, dir=entry.parent, suffix=".tmp") as tmp:
+            with open(source_path, "rb") as source:
+                shutil.copyfileobj(source, tmp)
+        os.replace(tmp.name, entry)
+        self.evict()
+
+    def evict(self):
+        """Удаляет давно не использованные записи, пока суммарный размер больше max_bytes."""
+        entries = []
+        total = 0
+        for path in self.cache_dir.glob("*/*.dxf"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:  # Уже удалена другим процессом
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+        if total <= self.max_bytes:
+            return
+        for _, size, path in sorted(entries):
+            path.unlink(missing_ok=True)
+            total -= size
+            if total <= self.max_bytes:
+                break
@@ -1,6 +1,6 @@
+import hashlib
 import json
 import os
-import shutil
 import tempfile
 from pathlib import Path
 
@@ -16,20 +16,27 @@ def read_index(index_json: str):
         return {}
 
 
-def write_index_safely(index_data, index_json: str):
-    try:
-        # 🔐 Бэкап перед перезаписью
-        if os.path.exists(index_json):
-            shutil.copy(index_json, index_json + ".bak")
-
-        # 💾 Безопасная запись через временный файл
-        with tempfile.NamedTemporaryFile("w", delete=False, dir=".", suffix=".json", encoding="utf-8") as tmp:
-            json.dump(index_data, tmp, ensure_ascii=False, indent=2)
-        os.replace(tmp.name, index_json)
-
-    except Exception as e:
-        print(f"‼️ Ошибка при сохранении index.json: {e}")
-
-
 def get_all_dxf_files(root):
     return [f for f in Path(root).rglob("*") if f.suffix.lower() == ".dxf"]
+
+
+def file_hash(path, chunk_size=1024 * 1024):
+    """SHA-256 содержимого файла (hex), читается блоками."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def write_atomically(target: Path, data: bytes):
+    """Записывает данные во временный файл рядом с target и заменяет им target."""
+    target.parent.mkdir(parents=True, exist_ok=True)
+    with tempfile.NamedTemporaryFile("wb", delete=False, suffix=".dxf.tmp", dir=target.parent) as tmp:
+        try:
+            tmp.write(data)
+        except BaseException:
+            tmp.close()
+            os.unlink(tmp.name)  # Недописанный временный файл не оставляем
+            raise
+    os.replace(tmp.name, target)
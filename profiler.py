@@ -0,0 +1,129 @@
+import cProfile
+import io
+import json
+import os
+import pstats
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+from metrics import ConversionMetrics
+
+# Сколько функций по каждому этапу попадает в текстовый отчёт profile.txt
+REPORT_LINES = 25
+
+
+class StageProfiler(ConversionMetrics):
+    """
+    ConversionMetrics, который вдобавок профилирует каждый этап отдельным cProfile.Profile.
+    Код вне этапов попадает в профиль "other". Во вложенном этапе профиль внешнего приостанавливается.
+    """
+
+    def __init__(self, path=None):
+        super().__init__(path)
+        self.profiles = {}  # этап -> cProfile.Profile
+        self._active = []
+
+    def _profile(self, name):
+        return self.profiles.setdefault(name, cProfile.Profile())
+
+    @contextmanager
+    def stage(self, name):
+        if self._active:
+            self._active[-1].disable()
+        profile = self._profile(name)
+        self._active.append(profile)
+        profile.enable()
+        try:
+            with super().stage(name):
+                yield
+        finally:
+            profile.disable()
+            self._active.pop()
+            if self._active:
+                self._active[-1].enable()
+
+    def run(self, func, *args, **kwargs):
+        """Вызывает func под профилем "other" (код вне этапов); этапы внутри профилируются отдельно."""
+        profile = self._profile("other")
+        self._active.append(profile)
+        profile.enable()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profile.disable()
+            self._active.pop()
+
+
+def prune_captures(capture_dir: Path, max_captures):
+    """Удаляет самые старые снимки, пока их больше max_captures."""
+    captures = sorted((path for path in capture_dir.iterdir() if path.is_dir()), key=lambda path: path.name)
+    for path in captures[:max(0, len(captures) - max_captures)]:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def new_capture(input_path, capture_dir, data=None) -> Path:
+    """
+    Создаёт новую папку снимка capture_dir/<время>_<pid>_<имя файла>_<случайный суффикс> (одноимённые файлы
+    из разных папок, попавшие в одну секунду, не смешиваются) и кладёт в неё копию исходного файла
+    (input.dxf): содержимое data, если оно уже в памяти, иначе копию input_path. input_path должен
+    ещё быть исходным (до замены результатом).
+    """
+    input_path = Path(input_path)
+    Path(capture_dir).mkdir(parents=True, exist_ok=True)
+    prefix = f"{time.strftime('%Y%m%d-%H%M%S')}_{os.getpid()}_{input_path.stem}_"
+    capture = Path(tempfile.mkdtemp(prefix=prefix, dir=capture_dir))
+    if data is not None:
+        (capture / "input.dxf").write_bytes(data)
+    else:
+        shutil.copyfile(input_path, capture / "input.dxf")
+    return capture
+
+
+def write_capture(capture: Path, profiler: StageProfiler, max_captures, reason, duration, details=None) -> Path:
+    """
+    Сохраняет в папку снимка профили по этапам (<этап>.pstats, открываются pstats.Stats),
+    текстовый отчёт profile.txt и summary.json с причиной, временем этапов и счётчиками объектов.
+    В папке снимков хранится не больше max_captures снимков.
+    """
+    report = io.StringIO()
+    for stage, profile in profiler.profiles.items():
+        profile.dump_stats(capture / f"{stage}.pstats")
+        seconds = f": {profiler.stages[stage]:.3f} с" if stage in profiler.stages else " (вне этапов)"
+        report.write(f"===== {stage}{seconds} =====\n")
+        pstats.Stats(profile, stream=report).sort_stats("cumulative").print_stats(REPORT_LINES)
+    (capture / "profile.txt").write_text(report.getvalue(), encoding="utf-8")
+
+    summary = {
+        "path": profiler.path,
+        "reason": reason,
+        "size": (capture / "input.dxf").stat().st_size,
+        "profiled_duration": duration,
+        "stages": profiler.stages,
+        "counters": profiler.counters,
+        **(details or {}),
+    }
+    (capture / "summary.json").write_text(json.dumps(summary, ensure_ascii=False, indent=2), encoding="utf-8")
+    prune_captures(capture.parent, max_captures)
+    return capture
+
+
+def capture_profile(capture: Path, input_path, convert, max_captures, reason, details=None) -> Path:
+    """
+    Дополняет снимок файла input_path, созданный new_capture, профилями: конвертация повторяется на копии input.dxf
+    функцией convert(input, output, metrics) под StageProfiler, результат повтора удаляется.
+    Так профилируются медленные файлы, замеченные уже после конвертации: повтор выполняется отдельно,
+    не удлиняя саму конвертацию.
+    """
+    source = capture / "input.dxf"
+    profiler = StageProfiler(str(input_path))
+    output = capture / "output.dxf.tmp"
+    started = time.perf_counter()
+    try:
+        profiler.run(convert, str(source), str(output), profiler)
+    finally:
+        duration = time.perf_counter() - started
+        output.unlink(missing_ok=True)
+    return write_capture(capture, profiler, max_captures, reason, duration, details)
@@ -0,0 +1,56 @@
+import json
+import shutil
+import time
+from pathlib import Path
+
+
+def failure_backoff(failures, base, max_delay):
+    """Задержка перед следующей попыткой после failures ошибок подряд: base, 2·base, 4·base... не больше max_delay."""
+    return min(base * 2 ** (failures - 1), max_delay)
+
+
+class Quarantine:
+    """
+    Папка для файлов, которые не удалось сконвертировать несколько раз подряд.
+
+    Файл переносится из INPUT_DIR в quarantine_dir/files/<относительный путь> и больше не обрабатывается;
+    причина записывается строкой JSON в quarantine_dir/quarantine.jsonl. Чтобы обработать файл снова
+    (например, после исправления чертежа), его достаточно вернуть в INPUT_DIR.
+    """
+
+    def __init__(self, quarantine_dir):
+        self.quarantine_dir = Path(quarantine_dir)
+        self.files_dir = self.quarantine_dir / "files"
+        self.log_path = self.quarantine_dir / "quarantine.jsonl"
+
+    def add(self, input_path: Path, rel_path, error, failures) -> Path:
+        """Переносит файл в карантин и записывает причину. Возвращает новый путь файла."""
+        target = self.files_dir / rel_path
+        target.parent.mkdir(parents=True, exist_ok=True)
+        shutil.move(str(input_path), str(target))
+        entry = {"path": rel_path, "error": error, "failures": failures, "time": time.time()}
+        with open(self.log_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        return target
+
+    def entries(self):
+        """Файлы, которые сейчас в карантине: последняя запись журнала по каждому пути, файл которого на месте."""
+        latest = {}
+        try:
+            with open(self.log_path, encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        latest[entry["path"]] = entry
+        except FileNotFoundError:
+            return []
+        return [entry for rel_path, entry in sorted(latest.items()) if (self.files_dir / rel_path).exists()]
+
+    def summary(self) -> str:
+        """Сводка для вывода в консоль: число файлов и причина по каждому."""
+        entries = self.entries()
+        if not entries:
+            return "Карантин пуст"
+        lines = [f"В карантине {len(entries)} файлов ({self.files_dir}):"]
+        lines += [f"  {entry['path']} — ошибок {entry['failures']}: {entry['error']}" for entry in entries]
+        return "\n".join(lines)
@@ -0,0 +1,120 @@
+import heapq
+import itertools
+import time
+from collections import deque
+
+from metrics import set_gauge
+
+SCHEDULE_POLICIES = ("fifo", "newest", "smallest")
+
+
+class ConversionQueue:
+    """
+    Очередь файлов на конвертацию с приоритетом и ограничением числа файлов в работе.
+
+    policy задаёт порядок: "fifo" — в порядке обнаружения, "newest" — сначала недавно изменённые,
+    "smallest" — сначала маленькие (один большой чертёж не задерживает десятки мелких).
+    fair_folders — чередовать папки первого уровня: большая выгрузка в одну папку не занимает всю очередь,
+    внутри папки порядок задаёт policy.
+    pop() выдаёт не больше max_in_flight файлов, пока по ним не вызван done(). Длина очереди, число файлов
+    в работе и ожидание самого старого файла публикуются как gauge queue_depth, in_flight и queue_oldest_wait,
+    при fair_folders — и длина очереди по папкам (queue_folder_depth).
+    """
+
+    def __init__(self, policy="fifo", fair_folders=False, max_in_flight=1):
+        if policy not in SCHEDULE_POLICIES:
+            raise ValueError(f"Неизвестный порядок очереди: {policy} (допустимо: {', '.join(SCHEDULE_POLICIES)})")
+        self.policy = policy
+        self.fair_folders = fair_folders
+        self.max_in_flight = max(1, max_in_flight)
+        self._heaps = {}  # папка -> куча (приоритет, номер поступления, input_path, rel_path)
+        self._folders = deque()  # папки с файлами в очереди, по кругу
+        self._queued = {}  # input_path -> время постановки в очередь (monotonic), в порядке постановки
+        self._in_flight = {}  # input_path -> (время постановки, время выдачи)
+        self._sequence = itertools.count()
+
+    def __len__(self):
+        return len(self._queued)
+
+    @property
+    def in_flight(self):
+        return len(self._in_flight)
+
+    def _priority(self, input_path):
+        if self.policy == "fifo":
+            return 0  # порядок задаёт номер поступления
+        stat = input_path.stat()
+        return -stat.st_mtime if self.policy == "newest" else stat.st_size
+
+    def push(self, input_path, rel_path) -> bool:
+        """
+        Ставит файл в очередь. Файл, который уже в очереди или в работе, повторно не ставится.
+        Возвращает False, если файл не поставлен (в том числе если он уже исчез).
+        """
+        if input_path in self._queued or input_path in self._in_flight:
+            return False
+        try:
+            priority = self._priority(input_path)
+        except FileNotFoundError:
+            return False
+        folder = rel_path.split("/", 1)[0] if self.fair_folders and "/" in rel_path else ""
+        heap = self._heaps.setdefault(folder, [])
+        if not heap:
+            self._folders.append(folder)
+        heapq.heappush(heap, (priority, next(self._sequence), input_path, rel_path))
+        self._queued[input_path] = time.monotonic()
+        self._publish()
+        return True
+
+    def pop(self):
+        """Следующий файл (input_path, rel_path) или None, если очередь пуста или достигнут предел max_in_flight."""
+        if not self._folders or len(self._in_flight) >= self.max_in_flight:
+            return None
+        folder = self._folders.popleft()
+        heap = self._heaps[folder]
+        _, _, input_path, rel_path = heapq.heappop(heap)
+        if heap:
+            self._folders.append(folder)
+        else:
+            del self._heaps[folder]
+        self._in_flight[input_path] = (self._queued.pop(input_path), time.monotonic())
+        self._publish()
+        return input_path, rel_path
+
+    def peek(self, count):
+        """Ближайшие count файлов (input_path) в том порядке, в котором их выдаст pop(), без изъятия из очереди."""
+        heads = [heapq.nsmallest(count, self._heaps[folder]) for folder in self._folders]
+        upcoming = []
+        # Папки выдаются по кругу: сначала первые файлы каждой папки, затем вторые и т. д.
+        for position in range(count):
+            upcoming += [items[position][2] for items in heads if position < len(items)]
+        return upcoming[:count]
+
+    def done(self, input_path) -> dict:
+        """
+        Отмечает окончание обработки файла. Возвращает время ожидания в очереди (queue_wait)
+        и полное время от постановки в очередь до окончания обработки (latency), секунд.
+        """
+        queued_at, started_at = self._in_flight.pop(input_path)
+        self._publish()
+        now = time.monotonic()
+        return {"queue_wait": started_at - queued_at, "latency": now - queued_at}
+
+    def stats(self) -> dict:
+        """Состояние очереди: длина, файлы в работе, ожидание самого старого файла, длина по папкам."""
+        now = time.monotonic()
+        return {
+            "queued": len(self._queued),
+            "in_flight": len(self._in_flight),
+            "max_in_flight": self.max_in_flight,
+            "oldest_wait": now - next(iter(self._queued.values()), now),
+            "folders": {folder: len(heap) for folder, heap in self._heaps.items()},
+        }
+
+    def _publish(self):
+        stats = self.stats()
+        set_gauge("queue_depth", stats["queued"])
+        set_gauge("in_flight", stats["in_flight"])
+        set_gauge("queue_oldest_wait", stats["oldest_wait"])
+        if self.fair_folders:
+            set_gauge("queue_folder_depth", {("folder", folder): depth for folder, depth in stats["folders"].items()})
@@ -0,0 +1,112 @@
+from array import array
+
+import numpy as np
+
+SEGMENT_LINE = 0
+SEGMENT_ARC = 1
+
+
+def bulges_vectorized(x1, y1, x2, y2, cx, cy):
+    """
+    Векторная версия arc_bulge: bulge для дуг от (x1, y1) к (x2, y2) с центром (cx, cy).
+    Формула та же — tan(центральный_угол / 4), угол через atan2(det, dot).
+    """
+    v1x, v1y = x1 - cx, y1 - cy
+    v2x, v2y = x2 - cx, y2 - cy
+    dot = v1x * v2x + v1y * v2y
+    det = v1x * v2y - v1y * v2x
+    return np.tan(np.arctan2(det, dot) / 4.0)
+
+
+def segment_row(entity):
+    """Строка таблицы сегментов для LINE или ARC: (kind, x1, y1, x2, y2, cx, cy, handle)."""
+    if entity.dxftype() == "LINE":
+        start, end = entity.dxf.start, entity.dxf.end
+        return SEGMENT_LINE, start.x, start.y, end.x, end.y, np.nan, np.nan, entity.dxf.handle
+    # ARC
+    start, end = entity.start_point, entity.end_point
+    center = entity.dxf.center
+    return SEGMENT_ARC, start.x, start.y, end.x, end.y, center.x, center.y, entity.dxf.handle
+
+
+class SegmentTable:
+    """
+    Компактная колоночная таблица сегментов LINE/ARC для построения цепочек.
+
+    Атрибуты ezdxf читаются один раз при извлечении, дальше цепочки строятся только по массивам.
+    bulge хранится для обоих направлений обхода: forward (start -> end) и reverse (end -> start).
+    Для LINE bulge всегда 0, центр — NaN.
+    """
+
+    def __init__(self, kind, x1, y1, x2, y2, cx, cy, handles):
+        self.kind = kind
+        self.x1, self.y1 = x1, y1
+        self.x2, self.y2 = x2, y2
+        self.cx, self.cy = cx, cy
+        self.handles = handles
+
+        is_arc = kind == SEGMENT_ARC
+        self.bulge_forward = np.zeros(len(kind))
+        self.bulge_reverse = np.zeros(len(kind))
+        self.bulge_forward[is_arc] = bulges_vectorized(x1[is_arc], y1[is_arc], x2[is_arc], y2[is_arc],
+                                                       cx[is_arc], cy[is_arc])
+        self.bulge_reverse[is_arc] = bulges_vectorized(x2[is_arc], y2[is_arc], x1[is_arc], y1[is_arc],
+                                                       cx[is_arc], cy[is_arc])
+
+    def __len__(self):
+        return len(self.kind)
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Строит таблицу из строк segment_row (порядок сохраняется)."""
+        builder = SegmentTableBuilder()
+        for row in rows:
+            builder.append(row)
+        return builder.build()
+
+    @classmethod
+    def from_entities(cls, entities):
+        """Однопроходное извлечение геометрии из списка LINE/ARC (порядок сохраняется)."""
+        return cls.from_rows(segment_row(entity) for entity in entities)
+
+    def take(self, indices):
+        """Таблица из строк с номерами indices (в указанном порядке)."""
+        indices = np.asarray(indices, dtype=np.intp)
+        return SegmentTable(self.kind[indices], self.x1[indices], self.y1[indices], self.x2[indices],
+                            self.y2[indices], self.cx[indices], self.cy[indices],
+                            [self.handles[i] for i in indices.tolist()])
+
+    @classmethod
+    def concat(cls, *tables):
+        """Таблица из строк tables подряд."""
+        columns = [np.concatenate([getattr(t, name) for t in tables])
+                   for name in ("kind", "x1", "y1", "x2", "y2", "cx", "cy")]
+        return cls(*columns, [handle for t in tables for handle in t.handles])
+
+
+class SegmentTableBuilder:
+    """
+    Накопитель строк segment_row в плоских массивах array вместо отдельного кортежа на сегмент.
+    Используется при потоковом чтении, когда сегменты поступают по одному.
+    """
+
+    def __init__(self):
+        self.kind = array("b")
+        self.coords = array("d")  # x1, y1, x2, y2, cx, cy подряд для каждого сегмента
+        self.handles = []
+
+    def __len__(self):
+        return len(self.kind)
+
+    def append(self, row):
+        self.kind.append(row[0])
+        self.coords.extend(row[1:7])
+        self.handles.append(row[7])
+
+    def build(self, *more):
+        """Таблица из этого накопителя и (следом, в том же порядке) накопителей more."""
+        builders = (self,) + more
+        kind = np.concatenate([np.frombuffer(b.kind, dtype=np.int8) for b in builders])
+        coords = np.concatenate([np.frombuffer(b.coords, dtype=float) for b in builders]).reshape(len(kind), 6).T
+        handles = [handle for b in builders for handle in b.handles]
+        return SegmentTable(kind, *coords, handles)
@@ -1,6 +1,9 @@
 from io import BytesIO
+from urllib.parse import urlencode
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 from constants import BASE_WEBHOOK
 
@@ -8,6 +11,71 @@ from constants import BASE_WEBHOOK
 SEND_MESSAGE_URL = f"{BASE_WEBHOOK}im.message.add.json"
 UPLOAD_FILE_URL = f"{BASE_WEBHOOK}im.disk.folder.uploadfile.json"
 
+REQUEST_TIMEOUT = (5, 30)  # секунды: установка соединения, ожидание ответа
+BATCH_LIMIT = 50  # максимум команд в одном вызове batch (ограничение Bitrix24)
+
+_session = None
+
+
+class B24Error(Exception):
+    """Ошибка, возвращённая REST API Bitrix24 (поле error в ответе)."""
+
+
+def make_session(pool_size=4, retries=3) -> requests.Session:
+    """
+    Сессия с пулом постоянных соединений к порталу.
+    Повторяет запрос при ошибке соединения и ответах 429/502/503/504 (Bitrix отвечает 503 при превышении
+    лимита запросов). Повтора после таймаута чтения нет: сообщение могло уже уйти, и оно задвоится.
+    """
+    retry = Retry(total=retries, connect=retries, read=0, status=retries, backoff_factor=0.5,
+                  status_forcelist=(429, 502, 503, 504), allowed_methods=None, raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+
+def get_session() -> requests.Session:
+    """Общая сессия модуля (создаётся при первом запросе)."""
+    global _session
+    if _session is None:
+        _session = make_session()
+    return _session
+
+
+def _message_fields(chat_id: str, message: str, user_id: int = None) -> dict:
+    if user_id:
+        message = f"[USER={user_id}][/USER], {message}"
+    return {"DIALOG_ID": chat_id, "MESSAGE": message}
+
+
+def message_command(chat_id: str, message: str, user_id: int = None) -> str:
+    """Команда im.message.add для batch (метод и параметры в виде строки запроса)."""
+    return "im.message.add?" + urlencode(_message_fields(chat_id, message, user_id))
+
+
+def call_batch(commands: dict, halt: bool = False, base_webhook: str = BASE_WEBHOOK, session=None) -> dict:
+    """
+    Выполняет до BATCH_LIMIT команд одним запросом batch.
+
+    :param commands: {ключ: "метод?параметры"}, например {"m0": message_command(...)}
+    :param halt: прервать выполнение на первой ошибке
+    :return: поле result ответа: {"result": {ключ: ...}, "result_error": {ключ: ...}, ...}
+    :raises B24Error: если Bitrix вернул ошибку для всего вызова
+    :raises requests.RequestException: при сетевой ошибке или ответе без JSON
+    """
+    if len(commands) > BATCH_LIMIT:
+        raise ValueError(f"В batch не больше {BATCH_LIMIT} команд, передано {len(commands)}")
+    session = session or get_session()
+    response = session.post(f"{base_webhook}batch.json", json={"halt": int(halt), "cmd": commands},
+                            timeout=REQUEST_TIMEOUT)
+    data = response.json()
+    if "error" in data:
+        raise B24Error(f"{data['error']}: {data.get('error_description', '')}")
+    response.raise_for_status()
+    return data.get("result", {})
+
 
 def send_message(chat_id: str, message: str, user_id: int = None) -> dict:
     """
@@ -18,33 +86,27 @@ def send_message(chat_id: str, message: str, user_id: int = None) -> dict:
     :param user_id: (опционально) ID пользователя Bitrix24
     :return: Ответ от Bitrix API
     """
-    if user_id:
-        full_message = f"[USER={user_id}][/USER], {message}"
-    else:
-        full_message = message
-
-    payload = {
-        "DIALOG_ID": chat_id,
-        "MESSAGE": full_message
-    }
-
-    response = requests.post(SEND_MESSAGE_URL, json=payload)
+    payload = _message_fields(chat_id, message, user_id)
+    response = get_session().post(SEND_MESSAGE_URL, json=payload, timeout=REQUEST_TIMEOUT)
     return response.json()
 
 
-def upload_file_to_folder(folder_id: str, file_buffer: BytesIO, filename: str = "screenshot.png"):
+def upload_file_to_folder(folder_id: str, file_buffer: BytesIO, filename: str = "screenshot.png",
+                          base_webhook: str = BASE_WEBHOOK, session=None):
+    session = session or get_session()
     # 1. Запрос на получение upload URL
-    url = f"{BASE_WEBHOOK}disk.folder.uploadfile.json"
+    url = f"{base_webhook}disk.folder.uploadfile.json"
     params = {
         "id": folder_id,
         "data": {"NAME": filename},
         "generateUniqueName": "Y"
     }
 
-    resp = requests.post(url, params=params)
-    upload_url = resp.json().get("result", {}).get("uploadUrl")
+    resp = session.post(url, params=params, timeout=REQUEST_TIMEOUT)
+    data = resp.json()
+    upload_url = data.get("result", {}).get("uploadUrl")
     if not upload_url:
-        raise Exception("Не удалось получить upload URL")
+        raise B24Error(f"Не удалось получить upload URL: {data}")
 
     # 2. Загрузка файла по uploadUrl
     file_buffer.seek(0)
@@ -52,13 +114,13 @@ def upload_file_to_folder(folder_id: str, file_buffer: BytesIO, filename: str =
         "file": (filename, file_buffer, "image/png")
     }
 
-    upload_response = requests.post(upload_url, files=files)
+    upload_response = session.post(upload_url, files=files, timeout=REQUEST_TIMEOUT)
     return upload_response.json()
 
 
-def get_public_link(file_id: str):
-    url = f"{BASE_WEBHOOK}disk.file.getExternalLink.json"
-    response = requests.post(url, params={"id": file_id})
+def get_public_link(file_id: str, base_webhook: str = BASE_WEBHOOK, session=None):
+    url = f"{base_webhook}disk.file.getExternalLink.json"
+    response = (session or get_session()).post(url, params={"id": file_id}, timeout=REQUEST_TIMEOUT)
 
     try:
         data = response.json()
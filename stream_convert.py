@@ -0,0 +1,273 @@
+import io
+import os
+
+import ezdxf
+from ezdxf.entities import Arc, LWPolyline
+from ezdxf.entities import factory
+from ezdxf.filemanagement import dxf_stream_info
+from ezdxf.lldxf.extendedtags import ExtendedTags
+from ezdxf.lldxf.tagwriter import TagWriter
+
+from contour_order import order_contours
+from convert_dxf import (CONVERTER_MARKER_TAG, build_contours, contour_layer, convert_dxf_with_bulge,
+                         converter_marker, half_circle_arcs)
+from metrics import ConversionMetrics
+from segment_table import SegmentTableBuilder, segment_row
+
+CHAIN_TYPES = ("LINE", "ARC", "CIRCLE")
+
+
+def _iter_entity_chunks(file, layout, start=None):
+    """
+    Однопроходное чтение файла парами строк (код, значение) без индекса и без загрузки документа.
+    Генерирует (номер, тип, сырые_байты) для каждого объекта секции ENTITIES, включая связанные
+    (VERTEX, SEQEND, ATTRIB); в памяти держится только текущий объект. Номер — порядковый номер объекта
+    в секции, он одинаков при повторном проходе и не зависит от наличия handle.
+    В layout записываются смещения: header_end (ENDSEC секции HEADER), entities_start (первый объект
+    ENTITIES) и entities_end (ENDSEC секции ENTITIES). start — уже известное entities_start:
+    чтение начинается сразу с объектов.
+    """
+    location = start or 0
+    file.seek(location)
+    in_entities = start is not None
+    section = None
+    expect_section_name = False
+    chunk = None
+    dxftype = None
+    number = 0
+    while True:
+        code_line = file.readline()
+        value_line = file.readline()
+        if not value_line:
+            raise ezdxf.DXFStructureError("Файл обрывается до конца секции ENTITIES")
+        tag_location = location
+        location += len(code_line) + len(value_line)
+        code = code_line.strip().lstrip(b"\xef\xbb\xbf")
+        value = value_line.strip()
+        if in_entities:
+            if code != b"0":
+                chunk.append(code_line + value_line)
+                continue
+            if chunk is not None:
+                yield number, dxftype, b"".join(chunk)
+                number += 1
+            if value == b"ENDSEC":
+                layout["entities_end"] = tag_location
+                return
+            chunk = [code_line + value_line]
+            dxftype = value.decode("ascii", errors="replace")
+        elif code == b"0" and value == b"SECTION":
+            expect_section_name = True
+        elif code == b"2" and expect_section_name:
+            expect_section_name = False
+            section = value
+            if section == b"ENTITIES":
+                in_entities = True
+                layout["entities_start"] = location
+        elif code == b"0" and value == b"ENDSEC" and section == b"HEADER":
+            layout["header_end"] = tag_location
+        elif code == b"0" and value == b"EOF":
+            return
+
+
+def _copy_range(file, out, start, end=None):
+    """Копирует байты файла с start до end (до конца файла, если end не задан) блоками по 1 МБ."""
+    file.seek(start)
+    remaining = end - start if end is not None else None
+    while remaining is None or remaining > 0:
+        chunk = file.read(1024 * 1024 if remaining is None else min(remaining, 1024 * 1024))
+        if not chunk:
+            break
+        out.write(chunk)
+        if remaining is not None:
+            remaining -= len(chunk)
+
+
+def _read_header_info(header_data):
+    """Кодировка и версия DXF по сырой секции HEADER."""
+    text = header_data.decode("utf-8", errors="ignore") + "  0\nENDSEC\n"
+    info = dxf_stream_info(io.StringIO(text))
+    return info.encoding, info.version
+
+
+def _load_entity(data, encoding):
+    """Разбирает сырые байты одного объекта в виртуальный (не привязанный к документу) объект ezdxf."""
+    text = data.decode(encoding, errors="surrogateescape").replace("\r\n", "\n")
+    return factory.load(ExtendedTags.from_text(text))
+
+
+def _read_handle_seed(header_data, encoding):
+    """Значение $HANDSEED из сырой секции HEADER (первый свободный handle)."""
+    lines = header_data.decode(encoding, errors="surrogateescape").splitlines()
+    for position in range(0, len(lines) - 3, 2):
+        if lines[position].strip() == "9" and lines[position + 1] == "$HANDSEED":
+            return lines[position + 3].strip()
+    raise ezdxf.DXFStructureError("В HEADER нет $HANDSEED")
+
+
+def _patch_header(header_data, encoding, marker, new_handle_seed):
+    """
+    Обновляет в сырой секции HEADER значение $HANDSEED и метку конвертера (после $LASTSAVEDBY,
+    как это делает ezdxf; в версиях до R2004 этой переменной нет, и метка не пишется).
+    """
+    newline = "\r\n" if b"\r\n" in header_data else "\n"
+    lines = header_data.decode(encoding, errors="surrogateescape").split(newline)
+    result = []
+    header_var = None
+    property_tag = None
+    position = 0
+    while position + 1 < len(lines):
+        code, value = lines[position], lines[position + 1]
+        position += 2
+        stripped_code = code.strip()
+        if stripped_code == "9":
+            header_var = value
+        elif header_var == "$HANDSEED" and stripped_code == "5":
+            value = new_handle_seed
+        elif header_var == "$CUSTOMPROPERTYTAG" and stripped_code == "1":
+            property_tag = value
+        elif header_var == "$CUSTOMPROPERTY" and stripped_code == "1" and property_tag == CONVERTER_MARKER_TAG:
+            value = marker
+            marker = None  # Метка уже есть, обновлена на месте
+        result += [code, value]
+        if header_var == "$LASTSAVEDBY" and stripped_code != "9" and marker is not None:
+            result += ["  9", "$CUSTOMPROPERTYTAG", "  1", CONVERTER_MARKER_TAG,
+                       "  9", "$CUSTOMPROPERTY", "  1", marker]
+            marker = None
+    result += lines[position:]
+    return newline.join(result).encode(encoding, errors="surrogateescape")
+
+
+def convert_dxf_streaming(input_path, output_path, tol=1e-2, metrics=None, blocks=False, depth_layers=False):
+    """
+    Экономичный по памяти вариант convert_dxf_with_bulge для очень больших чертежей.
+
+    Документ целиком не загружается и индекс файла не строится: файл читается последовательно
+    (_iter_entity_chunks), в первом проходе разбираются только LINE/ARC/CIRCLE пространства модели,
+    во втором все остальные объекты копируются в результат байт в байт, а вместо использованных
+    сегментов и кругов дописываются ARC и LWPOLYLINE. В памяти держатся таблица сегментов,
+    дуги из кругов и номера пропускаемых объектов. Геометрия результата совпадает с обычным режимом.
+    Определения блоков копируются как есть: если при blocks=True в пространстве модели есть INSERT,
+    используется обычный режим.
+    """
+    metrics = metrics if metrics is not None else ConversionMetrics(str(input_path))
+    print(f"Потоковое чтение файла: {input_path}")
+    try:
+        file = open(input_path, "rb")
+    except IOError:
+        print(f"Не удалось открыть файл: {input_path}")
+        return
+
+    with file:
+        # 1. Сбор геометрии LINE/ARC/CIRCLE из пространства модели
+        layout = {}
+        line_rows, arc_rows, circle_arc_rows = SegmentTableBuilder(), SegmentTableBuilder(), SegmentTableBuilder()
+        circle_arcs = []  # dxfattribs дуг, полученных из кругов
+        circle_chunks = set()
+        has_inserts = False
+        header_data = encoding = version = owner = None
+        try:
+            with metrics.stage("extract"):
+                for number, dxftype, data in _iter_entity_chunks(file, layout):
+                    if header_data is None:
+                        if "header_end" not in layout:
+                            break
+                        file_position = file.tell()
+                        file.seek(0)
+                        header_data = file.read(layout["header_end"])
+                        file.seek(file_position)
+                        encoding, version = _read_header_info(header_data)
+                        if version <= "AC1009":
+                            break
+                    metrics.count("entities_in")
+                    has_inserts = has_inserts or dxftype == "INSERT"
+                    if dxftype not in CHAIN_TYPES:
+                        continue
+                    entity = _load_entity(data, encoding)
+                    if entity.dxf.paperspace != 0:
+                        continue
+                    owner = owner or entity.dxf.owner
+                    # Вместо handle в таблицу пишется номер объекта: он есть и у объектов без handle
+                    if dxftype == "LINE":
+                        line_rows.append(segment_row(entity)[:7] + (number,))
+                    elif dxftype == "ARC":
+                        arc_rows.append(segment_row(entity)[:7] + (number,))
+                    else:  # CIRCLE
+                        circle_chunks.add(number)
+                        for arc_attribs in half_circle_arcs(entity):
+                            circle_arc_rows.append(segment_row(Arc.new(dxfattribs=arc_attribs)))
+                            circle_arcs.append(arc_attribs)
+        except ezdxf.DXFStructureError:
+            print(f"Ошибка структуры DXF файла: {input_path}")
+            return
+
+        if "entities_end" not in layout or version is None or version <= "AC1009":
+            # В DXF R12 нет LWPOLYLINE и handle объектов — используем обычный режим
+            print("Потоковый режим не поддерживает этот файл, используется обычная конвертация")
+            return convert_dxf_with_bulge(input_path, output_path, tol, metrics, blocks, depth_layers)
+        if blocks and has_inserts:
+            print("Потоковый режим не конвертирует блоки, используется обычная конвертация")
+            return convert_dxf_with_bulge(input_path, output_path, tol, metrics, blocks, depth_layers)
+
+        newline = "\r\n" if b"\r\n" in header_data else "\n"
+        metrics.count("bytes_read", os.path.getsize(input_path))
+        metrics.count("circles", len(circle_chunks))
+
+        print(f"Найдено исходных CIRCLE: {len(circle_chunks)}, создано ARC из них: {len(circle_arcs)}")
+        print(f"Всего для обработки: {len(line_rows)} LINE, {len(arc_rows) + len(circle_arc_rows)} ARC. "
+              f"Суммарно: {len(line_rows) + len(arc_rows) + len(circle_arc_rows)} объектов.")
+
+        # 2. Построение цепочек — так же, как в обычном режиме
+        segment_table = line_rows.build(arc_rows)
+        circle_arc_table = circle_arc_rows.build()
+        segments_total = len(segment_table) + len(circle_arc_table)
+        metrics.count("segments", segments_total)
+        with metrics.stage("chaining"):
+            final_chains, processed_segments, processed_circle_arcs = build_contours(segment_table,
+                                                                                     circle_arc_table, tol)
+        processed_total = len(processed_segments) + len(processed_circle_arcs)
+        metrics.count("chains", len(final_chains))
+        metrics.count("unclosed_leftovers", segments_total - processed_total)
+        print(f"Найдено замкнутых контуров: {len(final_chains)}")
+
+        skipped_chunks = {segment_table.handles[idx] for idx in processed_segments} | circle_chunks
+        print(f"Удалено использованных объектов LINE/ARC: {processed_total}")
+
+        # 3. Новые объекты: оставшиеся дуги из кругов и LWPOLYLINE, handle выдаются начиная с $HANDSEED
+        handle_seed = int(_read_handle_seed(header_data, encoding), 16)
+        new_entities = []
+        for k, arc_attribs in enumerate(circle_arcs):
+            if k not in processed_circle_arcs:
+                new_entities.append(Arc.new(handle=f"{handle_seed:X}", owner=owner, dxfattribs=arc_attribs))
+                handle_seed += 1
+        with metrics.stage("nesting"):
+            ordered_chains = order_contours(final_chains)
+        metrics.count("nested_contours", sum(1 for _, depth in ordered_chains if depth))
+        for vertices_for_lwpolyline, depth in ordered_chains:
+            lw = LWPolyline.new(handle=f"{handle_seed:X}", owner=owner,
+                                dxfattribs={"layer": contour_layer(depth, depth_layers)})
+            lw.set_points(vertices_for_lwpolyline, format="xyb")
+            lw.closed = True
+            new_entities.append(lw)
+            handle_seed += 1
+
+        # 4. Запись: HEADER с обновлёнными $HANDSEED и меткой, остальное копируется как есть
+        with metrics.stage("write"), open(output_path, "wb") as out:
+            marker = converter_marker(tol, blocks, depth_layers, f"{handle_seed:X}")
+            out.write(_patch_header(header_data, encoding, marker, f"{handle_seed:X}"))
+            _copy_range(file, out, layout["header_end"], layout["entities_start"])
+
+            for number, dxftype, data in _iter_entity_chunks(file, {}, layout["entities_start"]):
+                if number not in skipped_chunks:
+                    out.write(data)
+
+            text = io.StringIO()
+            tagwriter = TagWriter(text, version)
+            for entity in new_entities:
+                entity.export_dxf(tagwriter)
+            out.write(text.getvalue().replace("\n", newline).encode(encoding, errors="surrogateescape"))
+
+            _copy_range(file, out, layout["entities_end"])
+
+    metrics.count("bytes_written", os.path.getsize(output_path))
+    print(f"Сохранено как: {output_path}")
@@ -0,0 +1,69 @@
+import ezdxf
+import pytest
+
+from contour_order import order_contours
+from convert_dxf import convert_dxf_bytes, convert_dxf_with_bulge, is_already_converted
+from stream_convert import convert_dxf_streaming
+
+
+def make_drawing(path, closed=False):
+    """Чертёж из одной открытой линии и текста; closed — добавить квадрат из четырёх LINE."""
+    doc = ezdxf.new("R2010")
+    msp = doc.modelspace()
+    msp.add_line((0, 0), (10, 0))
+    msp.add_text("A", dxfattribs={"insert": (0, 5)})
+    if closed:
+        for start, end in [((20, 0), (30, 0)), ((30, 0), (30, 10)), ((30, 10), (20, 10)), ((20, 10), (20, 0))]:
+            msp.add_line(start, end)
+    block = doc.blocks.new("OPEN")
+    block.add_line((0, 0), (5, 5))
+    msp.add_blockref("OPEN", (50, 50))
+    doc.saveas(path)
+
+
+def lwpolylines(path):
+    return ezdxf.readfile(path).modelspace().query("LWPOLYLINE")
+
+
+def test_order_contours_empty():
+    assert order_contours([]) == []
+
+
+@pytest.mark.parametrize("blocks", [False, True])
+@pytest.mark.parametrize("closed", [False, True])
+def test_drawing_without_contours(tmp_path, closed, blocks):
+    # Чертёж без замкнутых контуров (или с блоком без них) конвертируется без ошибок всеми конвертерами
+    source = tmp_path / "in.dxf"
+    make_drawing(source, closed)
+    expected = 1 if closed else 0
+
+    output = tmp_path / "bytes.dxf"
+    output.write_bytes(convert_dxf_bytes(source.read_bytes(), blocks=blocks))
+    assert len(lwpolylines(output)) == expected
+
+    for name, convert in [("memory.dxf", convert_dxf_with_bulge), ("stream.dxf", convert_dxf_streaming)]:
+        output = tmp_path / name
+        convert(str(source), str(output), blocks=blocks)
+        assert len(lwpolylines(output)) == expected
+
+
+@pytest.mark.parametrize("convert", ["bytes", "memory", "stream"])
+def test_marker_invalidated_by_new_geometry(tmp_path, convert):
+    # Метка «уже сконвертирован» не должна переживать добавление объектов в сконвертированный чертёж
+    source = tmp_path / "in.dxf"
+    make_drawing(source, closed=True)
+    output = tmp_path / "out.dxf"
+    if convert == "bytes":
+        output.write_bytes(convert_dxf_bytes(source.read_bytes()))
+    else:
+        (convert_dxf_with_bulge if convert == "memory" else convert_dxf_streaming)(str(source), str(output))
+    assert is_already_converted(output)
+    assert is_already_converted(output.read_bytes())
+
+    doc = ezdxf.readfile(output)
+    msp = doc.modelspace()
+    msp.add_circle((100, 100), 5)
+    for start, end in [((0, 20), (10, 20)), ((10, 20), (10, 30)), ((10, 30), (0, 30)), ((0, 30), (0, 20))]:
+        msp.add_line(start, end)
+    doc.saveas(output)
+    assert not is_already_converted(output)
@@ -0,0 +1,97 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+import pytest
+
+from notifier import B24Notifier
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    """Заглушка Bitrix24: записывает вызовы, на batch.json отвечает статусами из server.batch_statuses."""
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length") or 0))
+        method = urlsplit(self.path).path.lstrip("/")
+        self.server.calls.append((time.monotonic(), method, body))
+        status, response = 200, {}
+        if method == "batch.json":
+            status = self.server.batch_statuses.pop(0) if self.server.batch_statuses else 200
+            commands = json.loads(body)["cmd"]
+            response = {"result": {"result": {key: True for key in commands}, "result_error": {}}}
+        data = json.dumps(response).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    server.calls = []
+    server.batch_statuses = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def batch_calls(server):
+    return [(called_at, json.loads(body)["cmd"]) for called_at, method, body in server.calls if method == "batch.json"]
+
+
+def make_notifier(server, **kwargs):
+    return B24Notifier(base_webhook=f"http://127.0.0.1:{server.server_port}/", **kwargs)
+
+
+def test_messages_coalesced_into_one_batch(stub):
+    notifier = make_notifier(stub, batch_window=0.3)
+    for k in range(3):
+        assert notifier.notify("chat1", f"файл {k}")
+    assert notifier.flush(10)
+    notifier.close()
+
+    calls = batch_calls(stub)
+    assert len(calls) == 1
+    assert sorted(calls[0][1]) == ["m0", "m1", "m2"]
+    assert (notifier.sent, notifier.dropped) == (3, 0)
+
+
+def test_batch_retried_with_backoff_on_503(stub):
+    stub.batch_statuses = [503, 503]
+    notifier = make_notifier(stub, batch_window=0.0, backoff=0.1)
+    notifier.notify("chat1", "файл")
+    assert notifier.flush(10)
+    notifier.close()
+
+    calls = batch_calls(stub)
+    assert len(calls) == 3
+    # Пауза перед повтором удваивается: backoff, затем 2·backoff
+    assert calls[1][0] - calls[0][0] >= 0.1
+    assert calls[2][0] - calls[1][0] >= 0.2
+    assert (notifier.sent, notifier.dropped) == (1, 0)
+
+
+def test_failed_upload_keeps_other_messages(stub):
+    # Заглушка не возвращает uploadUrl: загрузка файла не удаётся ни с одной попытки
+    notifier = make_notifier(stub, batch_window=0.3, max_retries=1, backoff=0.01)
+    notifier.notify("chat1", "до")
+    notifier.notify_file("1", b"png", "shot.png", "chat1", "скриншот")
+    notifier.notify("chat1", "после")
+    assert notifier.flush(10)
+    notifier.close()
+
+    uploads = [call for call in stub.calls if call[1] == "disk.folder.uploadfile.json"]
+    assert len(uploads) == 2
+    calls = batch_calls(stub)
+    assert len(calls) == 1
+    assert len(calls[0][1]) == 2
+    assert (notifier.sent, notifier.dropped) == (2, 1)
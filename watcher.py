@@ -0,0 +1,187 @@
+import ctypes
+import ctypes.util
+import os
+import re
+import select
+import struct
+import sys
+import time
+from pathlib import Path
+
+# Флаги inotify (linux/inotify.h)
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = os.O_NONBLOCK if hasattr(os, "O_NONBLOCK") else 0
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = (IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+              | IN_DELETE_SELF | IN_MOVE_SELF)
+
+_EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, len
+
+
+def is_dxf(path: Path) -> bool:
+    return path.suffix.lower() == ".dxf"
+
+
+class InotifyWatcher:
+    """
+    Отслеживает изменения DXF файлов в дереве папок через inotify (Linux).
+
+    Путь считается готовым к обработке, когда по нему не было событий debounce секунд —
+    так файлы, которые ещё копируются или записываются, не попадают в обработку раньше времени.
+    Если очередь событий ядра переполнилась или папка была перемещена, выставляется
+    needs_full_scan: вызывающий код должен выполнить полное сканирование.
+    """
+
+    def __init__(self, root, debounce=0.5):
+        self.root = Path(root)
+        self.debounce = debounce
+        self.needs_full_scan = False
+        self._pending = {}  # Path -> время последнего события (monotonic)
+        self._watches = {}  # wd -> Path папки
+
+        self._libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self._add_tree(self.root)
+
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+    def _add_watch(self, directory: Path):
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(directory), WATCH_MASK)
+        if wd < 0:
+            print(f"‼️ Не удалось подписаться на изменения в {directory}: {os.strerror(ctypes.get_errno())}")
+            return
+        self._watches[wd] = directory
+
+    def _add_tree(self, directory: Path, mark_files=False):
+        """Подписывается на папку и все вложенные; mark_files — поставить найденные DXF в очередь."""
+        for current, dirnames, filenames in os.walk(directory):
+            self._add_watch(Path(current))
+            if mark_files:
+                now = time.monotonic()
+                for name in filenames:
+                    if is_dxf(Path(name)):
+                        self._pending[Path(current) / name] = now
+
+    def _read_events(self):
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return
+        now = time.monotonic()
+        offset = 0
+        while offset < len(data):
+            wd, mask, _cookie, name_len = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset:offset + name_len].rstrip(b"\0")
+            offset += name_len
+
+            if mask & IN_Q_OVERFLOW:
+                self.needs_full_scan = True
+                continue
+            if mask & IN_IGNORED:
+                self._watches.pop(wd, None)
+                continue
+            directory = self._watches.get(wd)
+            if directory is None or not name:
+                continue
+
+            path = directory / os.fsdecode(name)
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    # Новая папка: подписываемся и забираем файлы, появившиеся до подписки
+                    self._add_tree(path, mark_files=True)
+                elif mask & IN_MOVED_FROM:
+                    # Файлы перемещённой папки исчезли без отдельных событий
+                    self.needs_full_scan = True
+            elif is_dxf(path):
+                self._pending[path] = now
+
+    def wait(self, timeout):
+        """
+        Ждёт событий не дольше timeout секунд и возвращает список путей, готовых к обработке
+        (созданные, изменённые или удалённые DXF). Возвращается раньше, как только есть готовые пути.
+        При timeout == 0 только забирает уже пришедшие события, не ожидая новых.
+        """
+        self._read_events()
+        deadline = time.monotonic() + timeout
+        while True:
+            now = time.monotonic()
+            ready = [path for path, last_event in self._pending.items() if now - last_event >= self.debounce]
+            if ready or self.needs_full_scan or now >= deadline:
+                for path in ready:
+                    del self._pending[path]
+                return ready
+
+            wait_for = deadline - now
+            if self._pending:
+                wait_for = min(wait_for, min(self._pending.values()) + self.debounce - now)
+            readable, _, _ = select.select([self._fd], [], [], max(0.0, wait_for))
+            if readable:
+                self._read_events()
+
+
+# Сетевые и пользовательские файловые системы: изменения, сделанные другими клиентами, не порождают событий inotify
+NETWORK_FILESYSTEMS = {"cifs", "smb3", "smbfs", "nfs", "nfs4", "afs", "9p", "ceph", "glusterfs", "lustre",
+                       "davfs", "fuse.sshfs", "fuse.glusterfs", "fuse.davfs2", "fuse.rclone", "fuse.s3fs"}
+MOUNTS_FILE = "/proc/mounts"
+
+
+def filesystem_type(path):
+    """Тип файловой системы, на которой находится path, по /proc/mounts (самая длинная точка монтирования), или None."""
+    target = os.path.realpath(path)
+    best, best_type = "", None
+    try:
+        with open(MOUNTS_FILE, encoding="utf-8", errors="replace") as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) < 3:
+                    continue
+                # Пробелы и пр. в точке монтирования записаны восьмеричными escape-последовательностями (\040)
+                mount_point = re.sub(r"\\([0-7]{3})", lambda m: chr(int(m.group(1), 8)), fields[1])
+                inside = target == mount_point or target.startswith(mount_point.rstrip("/") + "/")
+                if inside and len(mount_point) >= len(best):
+                    best, best_type = mount_point, fields[2]
+    except OSError:
+        return None
+    return best_type
+
+
+def is_network_filesystem(path) -> bool:
+    return filesystem_type(path) in NETWORK_FILESYSTEMS
+
+
+def create_watcher(root, debounce=0.5, mode="auto"):
+    """
+    Возвращает InotifyWatcher или None — тогда работает периодический опрос.
+    mode: "inotify" — всегда inotify (если доступен), "poll" — всегда опрос, "auto" — inotify, кроме сетевых
+    файловых систем (CIFS/SMB, NFS и т. п.): на них файлы, записанные другими клиентами, событий не порождают.
+    """
+    if mode not in ("auto", "inotify", "poll"):
+        raise ValueError(f"Неизвестный режим отслеживания: {mode} (допустимо: auto, inotify, poll)")
+    if mode == "poll" or not sys.platform.startswith("linux"):
+        return None
+    if mode == "auto" and is_network_filesystem(root):
+        print(f"🌐 {root} на сетевой файловой системе ({filesystem_type(root)}), используется периодическое "
+              f"сканирование")
+        return None
+    try:
+        return InotifyWatcher(root, debounce)
+    except (OSError, AttributeError) as e:
+        print(f"‼️ inotify недоступен, используется периодическое сканирование: {e}")
+        return None
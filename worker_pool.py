@@ -0,0 +1,163 @@
+import queue
+import threading
+import time
+import multiprocessing
+from multiprocessing.connection import wait
+
+try:
+    import resource
+except ImportError:  # Windows: ограничение памяти процесса недоступно
+    resource = None
+
+_NO_ITEM = object()
+
+
+class JobError(str):
+    """
+    Текст ошибки задания (result при ok == False) с видом ошибки в kind:
+    "error" — исключение в func, "io" — ошибка ввода-вывода (OSError), "memory" — нехватка памяти,
+    "timeout" — превышено время, "crashed" — процесс завершился аварийно.
+    """
+
+    def __new__(cls, message, kind="error"):
+        error = super().__new__(cls, message)
+        error.kind = kind
+        return error
+
+
+def _job_error(e):
+    """JobError по исключению из func."""
+    return JobError(str(e) or repr(e), "io" if isinstance(e, OSError) else "error")
+
+
+def _run_job(conn, func, item, memory_limit=None):
+    """Выполняется в дочернем процессе: отправляет родителю (успех, результат или JobError)."""
+    try:
+        if memory_limit and resource is not None:
+            resource.setrlimit(resource.RLIMIT_AS, (memory_limit, memory_limit))
+        conn.send((True, func(item)))
+    except MemoryError:
+        conn.send((False, JobError(f"превышен лимит памяти ({memory_limit // 1024 ** 2} МБ)" if memory_limit
+                                   else "недостаточно памяти", "memory")))
+    except BaseException as e:
+        conn.send((False, _job_error(e)))
+    finally:
+        conn.close()
+
+
+def run_in_processes(func, items, max_workers, timeout, start_method=None, memory_limit=None):
+    """
+    Выполняет func(item) для каждого item в отдельном процессе, не более max_workers одновременно.
+
+    Генерирует кортежи (item, ok, result): при ok == False в result текст ошибки (JobError).
+    Падение процесса (в т.ч. аварийное) или превышение timeout секунд затрагивает только свой файл:
+    зависший процесс принудительно завершается, остальные задания продолжают выполняться.
+    func должна быть функцией уровня модуля (для запуска через spawn на Windows).
+    start_method — способ запуска процессов ("spawn", "fork"...), по умолчанию системный.
+    items может быть генератором: следующий элемент берётся только при освободившемся месте, поэтому
+    источник может выбирать задание по приоритету в момент запуска.
+    memory_limit — предел адресного пространства процесса в байтах (RLIMIT_AS, только Unix): при превышении
+    задание завершается ошибкой, не отнимая память у остальных.
+    """
+    context = multiprocessing.get_context(start_method)
+    pending = iter(items)
+    exhausted = False
+    running = {}  # conn -> (item, process, deadline)
+
+    while not exhausted or running:
+        while not exhausted and len(running) < max_workers:
+            item = next(pending, _NO_ITEM)
+            if item is _NO_ITEM:
+                exhausted = True
+                break
+            parent_conn, child_conn = context.Pipe(duplex=False)
+            process = context.Process(target=_run_job, args=(child_conn, func, item, memory_limit),
+                                      daemon=True)
+            process.start()
+            child_conn.close()
+            running[parent_conn] = (item, process, time.monotonic() + timeout)
+        if not running:
+            break
+
+        nearest_deadline = min(deadline for _, _, deadline in running.values())
+        for conn in wait(list(running), timeout=max(0.0, nearest_deadline - time.monotonic())):
+            item, process, _ = running.pop(conn)
+            try:
+                ok, result = conn.recv()
+            except EOFError:
+                # Процесс умер, не успев отправить результат
+                process.join()
+                ok, result = False, JobError(f"процесс обработки завершился аварийно (код {process.exitcode})",
+                                             "crashed")
+            conn.close()
+            process.join()
+            yield item, ok, result
+
+        now = time.monotonic()
+        for conn, (item, process, deadline) in list(running.items()):
+            if now >= deadline:
+                process.terminate()
+                process.join()
+                conn.close()
+                del running[conn]
+                yield item, False, JobError(f"превышено время обработки ({timeout} с)", "timeout")
+
+
+def run_sequentially(func, items):
+    """Аналог run_in_processes в текущем процессе (по одному, без лимитов времени и памяти)."""
+    for item in items:
+        try:
+            result = func(item)
+        except Exception as e:
+            yield item, False, _job_error(e)
+        else:
+            yield item, True, result
+
+
+class BackgroundJobs:
+    """
+    Фоновые задания с низким приоритетом: поток по одному запускает func(item) через run_in_processes
+    (отдельный процесс со своим лимитом timeout и memory_limit), не задерживая основную обработку.
+    В очереди ждёт не больше max_pending заданий, submit() сверх этого отбрасывает задание.
+    on_result(item, ok, result) вызывается в фоновом потоке.
+    """
+
+    def __init__(self, func, timeout, max_pending, on_result, start_method=None, memory_limit=None):
+        self.func = func
+        self.timeout = timeout
+        self.on_result = on_result
+        self.start_method = start_method
+        self.memory_limit = memory_limit
+        self._queue = queue.Queue(maxsize=max(1, max_pending))
+        self._closing = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="background-jobs", daemon=True)
+        self._thread.start()
+
+    def submit(self, item) -> bool:
+        """Ставит задание в очередь. Возвращает False, если очередь заполнена."""
+        try:
+            self._queue.put_nowait(item)
+            return True
+        except queue.Full:
+            return False
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is _NO_ITEM or self._closing.is_set():
+                return
+            try:
+                for _, ok, result in run_in_processes(self.func, [item], 1, self.timeout, self.start_method,
+                                                      self.memory_limit):
+                    self.on_result(item, ok, result)
+            except Exception as e:  # Поток фоновых заданий не должен умирать из-за одного задания
+                self.on_result(item, False, str(e) or repr(e))
+
+    def close(self, timeout=None):
+        """Останавливает поток после текущего задания (ждущие отбрасываются); ждёт не дольше timeout секунд."""
+        self._closing.set()
+        try:
+            self._queue.put_nowait(_NO_ITEM)
+        except queue.Full:
+            pass  # Поток увидит _closing, когда возьмёт следующее задание
+        self._thread.join(timeout)